@@ -21,10 +21,15 @@ if config.config_file_name is not None:
 
 # add your model's MetaData object here
 # for 'autogenerate' support
-from backend.db.config import Base
+from backend.db.config import Base, DATABASE_URL
 from backend.db import models  # Import models to register them
 target_metadata = Base.metadata
 
+# Migrate the database the app actually uses (AI_MESSAGE_DATABASE_URL, from the
+# environment or .env) rather than the placeholder URL in alembic.ini.
+# ConfigParser treats % as interpolation, so escape it for URL-encoded passwords.
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -0,0 +1,32 @@
+"""unique phone_normalized
+
+Revision ID: 0a9e4b7c13d2
+Revises: f2a7c5d08e31
+Create Date: 2026-10-16 00:41:18.204733
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0a9e4b7c13d2'
+down_revision: Union[str, None] = 'f2a7c5d08e31'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Fails if two users hold the same number in different formats; resolve
+    # those rows before upgrading
+    op.drop_index(op.f('ix_users_phone_normalized'), table_name='users')
+    op.create_index(op.f('ix_users_phone_normalized'), 'users', ['phone_normalized'], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_phone_normalized'), table_name='users')
+    op.create_index(op.f('ix_users_phone_normalized'), 'users', ['phone_normalized'], unique=False)
@@ -0,0 +1,35 @@
+"""message sender and recipient indexes
+
+Revision ID: 1c6f3e8a9b54
+Revises: 0a9e4b7c13d2
+Create Date: 2026-10-16 01:02:44.918362
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '1c6f3e8a9b54'
+down_revision: Union[str, None] = '0a9e4b7c13d2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_sender_created', 'messages', ['sender_id', 'created_at'], unique=False)
+    op.create_index('ix_messages_recipient_created', 'messages', ['recipient_id', 'created_at'], unique=False)
+    # Both single-column indexes are prefixes of the composites above
+    op.drop_index(op.f('ix_messages_sender_id'), table_name='messages')
+    op.drop_index(op.f('ix_messages_recipient_id'), table_name='messages')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_messages_recipient_id'), 'messages', ['recipient_id'], unique=False)
+    op.create_index(op.f('ix_messages_sender_id'), 'messages', ['sender_id'], unique=False)
+    op.drop_index('ix_messages_recipient_created', table_name='messages')
+    op.drop_index('ix_messages_sender_created', table_name='messages')
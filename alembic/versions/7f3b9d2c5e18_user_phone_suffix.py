@@ -0,0 +1,50 @@
+"""user phone suffix
+
+Revision ID: 7f3b9d2c5e18
+Revises: 1c6f3e8a9b54
+Create Date: 2026-10-16 01:02:47.531904
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3b9d2c5e18'
+down_revision: Union[str, None] = '1c6f3e8a9b54'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('phone_suffix', sa.String(length=10), nullable=True))
+    op.create_index(op.f('ix_users_phone_suffix'), 'users', ['phone_suffix'], unique=False)
+
+    # Backfill the last 10 digits for existing numbers long enough to match on
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer),
+        sa.column('phone_normalized', sa.String),
+        sa.column('phone_suffix', sa.String),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(users.c.id, users.c.phone_normalized).where(users.c.phone_normalized.isnot(None))).all()
+    updates = [
+        {"user_id": user_id, "suffix": digits[-10:]}
+        for user_id, digits in rows
+        if len(digits) >= 10
+    ]
+    if updates:
+        bind.execute(
+            users.update().where(users.c.id == sa.bindparam('user_id')).values(phone_suffix=sa.bindparam('suffix')),
+            updates
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_phone_suffix'), table_name='users')
+    op.drop_column('users', 'phone_suffix')
@@ -0,0 +1,34 @@
+"""message query indexes
+
+Revision ID: b7e2c4a91d3f
+Revises: 4310ac406c28
+Create Date: 2026-10-15 23:10:42.118204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2c4a91d3f'
+down_revision: Union[str, None] = '4310ac406c28'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_messages_conversation_created', 'messages', ['conversation_id', 'created_at'], unique=False)
+    op.create_index(
+        'ix_messages_recipient_unread', 'messages', ['recipient_id'], unique=False,
+        postgresql_where=sa.text('is_read = false'),
+        sqlite_where=sa.text('is_read = 0')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_messages_recipient_unread', table_name='messages')
+    op.drop_index('ix_messages_conversation_created', table_name='messages')
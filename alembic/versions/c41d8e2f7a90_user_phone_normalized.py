@@ -0,0 +1,49 @@
+"""user phone normalized
+
+Revision ID: c41d8e2f7a90
+Revises: b7e2c4a91d3f
+Create Date: 2026-10-15 23:32:18.440917
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c41d8e2f7a90'
+down_revision: Union[str, None] = 'b7e2c4a91d3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('users', sa.Column('phone_normalized', sa.String(length=20), nullable=True))
+    op.create_index(op.f('ix_users_phone_normalized'), 'users', ['phone_normalized'], unique=False)
+
+    # Backfill the digits-only copy for existing phone numbers
+    users = sa.table(
+        'users',
+        sa.column('id', sa.Integer),
+        sa.column('phone_number', sa.String),
+        sa.column('phone_normalized', sa.String),
+    )
+    bind = op.get_bind()
+    rows = bind.execute(sa.select(users.c.id, users.c.phone_number).where(users.c.phone_number.isnot(None))).all()
+    updates = [
+        {"user_id": user_id, "digits": "".join(filter(str.isdigit, phone)) or None}
+        for user_id, phone in rows
+    ]
+    if updates:
+        bind.execute(
+            users.update().where(users.c.id == sa.bindparam('user_id')).values(phone_normalized=sa.bindparam('digits')),
+            updates
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_users_phone_normalized'), table_name='users')
+    op.drop_column('users', 'phone_normalized')
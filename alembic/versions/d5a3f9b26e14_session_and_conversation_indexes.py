@@ -0,0 +1,31 @@
+"""session and conversation indexes
+
+Revision ID: d5a3f9b26e14
+Revises: c41d8e2f7a90
+Create Date: 2026-10-15 23:41:07.512336
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd5a3f9b26e14'
+down_revision: Union[str, None] = 'c41d8e2f7a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # ix_messages_conversation_created already serves conversation_id lookups
+    op.drop_index(op.f('ix_messages_conversation_id'), table_name='messages')
+    op.create_index('ix_sessions_user_active', 'sessions', ['user_id', 'is_active'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_sessions_user_active', table_name='sessions')
+    op.create_index(op.f('ix_messages_conversation_id'), 'messages', ['conversation_id'], unique=False)
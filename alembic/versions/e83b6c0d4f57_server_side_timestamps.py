@@ -0,0 +1,47 @@
+"""server side timestamps
+
+Revision ID: e83b6c0d4f57
+Revises: d5a3f9b26e14
+Create Date: 2026-10-15 23:52:31.207645
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e83b6c0d4f57'
+down_revision: Union[str, None] = 'd5a3f9b26e14'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('users', 'roles', 'user_roles', 'sessions', 'refresh_tokens', 'messages', 'reports')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Columns stay naive UTC; only the default moves into the database
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            for column in ('created_at', 'updated_at'):
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.DateTime(),
+                    server_default=sa.func.now(),
+                    existing_nullable=False
+                )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            for column in ('created_at', 'updated_at'):
+                batch_op.alter_column(
+                    column,
+                    existing_type=sa.DateTime(),
+                    server_default=None,
+                    existing_nullable=False
+                )
@@ -0,0 +1,33 @@
+"""drop primary key indexes
+
+Revision ID: f2a7c5d08e31
+Revises: e83b6c0d4f57
+Create Date: 2026-10-16 00:14:52.630918
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a7c5d08e31'
+down_revision: Union[str, None] = 'e83b6c0d4f57'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('users', 'roles', 'user_roles', 'sessions', 'refresh_tokens', 'messages', 'reports')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Each ix_<table>_id duplicates the primary key index
+    for table in TABLES:
+        op.drop_index(op.f(f'ix_{table}_id'), table_name=table)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in TABLES:
+        op.create_index(op.f(f'ix_{table}_id'), table, ['id'], unique=False)
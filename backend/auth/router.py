@@ -2,13 +2,14 @@ import logging
 from datetime import datetime, timedelta
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Request
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy import func
+from sqlalchemy import func, case, and_, insert, select, lambda_stmt
 
-from db.config import get_db
-from db.models import User, Session as UserSession, RefreshToken, Role, UserRole, Message
+from db.config import get_db, SessionLocal
+from db.models import User, Session as UserSession, RefreshToken, Role, UserRole, Message, normalize_phone
 from auth.schemas import (
     UserCreate, UserUpdate, UserResponse, LoginRequest, Token,
     ChangePasswordRequest, SessionResponse, RoleCreate, RoleResponse,
@@ -16,40 +17,51 @@ from auth.schemas import (
     ConversationResponse, AuthResponse
 )
 from auth.utils import (
-    verify_password, get_password_hash, create_access_token, create_refresh_token,
-    decode_token, get_current_user, require_superuser, generate_session_token
+    verify_password, get_password_hash, needs_rehash, create_access_token, create_refresh_token,
+    decode_token, get_current_user, require_superuser, generate_session_token,
+    invalidate_cached_user, TokenUser, is_login_throttled, record_failed_login,
+    clear_failed_logins, LOGIN_THROTTLE_WINDOW_SECONDS
 )
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
+# Handlers are plain `def` because they use the blocking SQLAlchemy Session;
+# FastAPI runs them in its threadpool so DB waits never block the event loop.
+
 # Auth module logger
 auth_logger = logging.getLogger("auth")
 
 
+# Rows fetched and serialized per chunk when streaming list responses
+LIST_STREAM_BATCH_SIZE = 500
+
+# List endpoints select only the columns their response schema exposes, so rows
+# skip ORM hydration and never load hashed passwords or refresh tokens
+_USER_COLUMNS = tuple(getattr(User, name) for name in UserResponse.model_fields)
+_SESSION_COLUMNS = tuple(getattr(UserSession, name) for name in SessionResponse.model_fields)
+_ROLE_COLUMNS = tuple(getattr(Role, name) for name in RoleResponse.model_fields)
+
+
+def _duplicate_user_detail(error: IntegrityError) -> str:
+    """Map a unique violation on the users table to a client-facing message"""
+    diag = getattr(error.orig, "diag", None)
+    violated = (getattr(diag, "constraint_name", None) or str(error.orig)).lower()
+    if "username" in violated:
+        return "Username already registered"
+    if "email" in violated:
+        return "Email already registered"
+    if "phone" in violated:
+        return "Phone number already registered"
+    return "Username or email already exists"
+
+
 # ==================== AUTHENTICATION ====================
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+def register(user_data: UserCreate, db: Session = Depends(get_db)):
     """Register a new user"""
-    # Check if username exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
-        auth_logger.warning(f"Registration failed: username '{user_data.username}' already exists")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    # Check if email exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
-    if existing_email:
-        auth_logger.warning(f"Registration failed: email '{user_data.email}' already exists")
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
-    # Create new user
+    # Uniqueness is enforced by the database; a single INSERT replaces the
+    # username/email pre-checks and cannot race with concurrent registrations
     user = User(
         username=user_data.username,
         email=user_data.email,
@@ -63,28 +75,43 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         db.commit()
         db.refresh(user)
         auth_logger.info(f"User registered successfully: {user_data.username} (email: {user_data.email})")
-    except IntegrityError:
+    except IntegrityError as e:
         db.rollback()
-        auth_logger.error(f"Registration failed: integrity error for username '{user_data.username}'")
+        detail = _duplicate_user_detail(e)
+        auth_logger.warning(f"Registration failed for username '{user_data.username}': {detail}")
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username or email already exists"
+            detail=detail
         )
     
     return user
 
 
 @router.post("/login", response_model=AuthResponse)
-async def login(
+def login(
     login_data: LoginRequest,
     request: Request,
     db: Session = Depends(get_db)
 ):
     """Login and get access/refresh tokens"""
-    # Find user by username
-    user = db.query(User).filter(User.username == login_data.username).first()
+    # Shed repeated failures before spending a bcrypt verification on them
+    client_host = request.client.host if request.client else None
+    if is_login_throttled(client_host, login_data.username):
+        auth_logger.warning(f"Login throttled for username '{login_data.username}' from {client_host}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many failed login attempts, try again later",
+            headers={"Retry-After": str(LOGIN_THROTTLE_WINDOW_SECONDS)},
+        )
+    
+    # Find user by username (lambda_stmt caches the compiled statement)
+    username = login_data.username
+    user = db.execute(
+        lambda_stmt(lambda: select(User).where(User.username == username))
+    ).scalars().first()
     
     if not user or not verify_password(login_data.password, user.hashed_password):
+        record_failed_login(client_host, login_data.username)
         auth_logger.warning(f"Login failed: incorrect credentials for username '{login_data.username}'")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -99,8 +126,14 @@ async def login(
             detail="User is disabled"
         )
     
+    clear_failed_logins(client_host, login_data.username)
+    
+    # Upgrade hashes made with an older work factor; saved with the login commit
+    if needs_rehash(user.hashed_password):
+        user.hashed_password = get_password_hash(login_data.password)
+    
     # Create tokens
-    access_token = create_access_token(user.id, user.username)
+    access_token = create_access_token(user.id, user.username, is_superuser=user.is_superuser)
     refresh_token = create_refresh_token(user.id, user.username)
     
     # Store refresh token in database
@@ -112,7 +145,6 @@ async def login(
     db.add(refresh_token_db)
     
     # Create session
-    client_host = request.client.host if request.client else None
     user_session = UserSession(
         user_id=user.id,
         session_token=generate_session_token(),
@@ -134,7 +166,7 @@ async def login(
 
 
 @router.post("/refresh", response_model=Token)
-async def refresh_token(
+def refresh_token(
     refresh_data: RefreshTokenRequest,
     db: Session = Depends(get_db)
 ):
@@ -151,34 +183,37 @@ async def refresh_token(
     user_id: int = payload.get("sub")
     username: str = payload.get("username")
     
-    # Check if refresh token exists and is valid
+    # Check if refresh token exists and is valid; expiry is filtered in SQL.
+    # Stored expiries are naive UTC, so compare against a bound utcnow() rather
+    # than the server's func.now(), which may be in local time.
     stored_token = db.query(RefreshToken).filter(
         RefreshToken.token == refresh_data.refresh_token,
-        RefreshToken.is_used == False
+        RefreshToken.is_used == False,
+        RefreshToken.expires_at > datetime.utcnow()
     ).first()
     
     if not stored_token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Refresh token not found or already used",
+            detail="Refresh token not found, already used or expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    if stored_token.expires_at < datetime.utcnow():
-        db.delete(stored_token)
-        db.commit()
+    # Re-read the user so a disabled account cannot refresh and the new access
+    # token carries the current superuser flag
+    user = db.get(User, stored_token.user_id)
+    if user is None or not user.is_active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Refresh token expired",
+            detail="User not found or disabled",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Mark old token as used
+    # Mark old token as used; committed together with its replacement below
     stored_token.is_used = True
-    db.commit()
     
     # Create new tokens
-    access_token = create_access_token(user_id, username)
+    access_token = create_access_token(user_id, username, is_superuser=user.is_superuser)
     refresh_token = create_refresh_token(user_id, username)
     
     # Store new refresh token
@@ -198,7 +233,7 @@ async def refresh_token(
 
 
 @router.post("/logout")
-async def logout(
+def logout(
     refresh_data: Optional[RefreshTokenRequest] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -220,7 +255,7 @@ async def logout(
 
 
 @router.post("/logout-all")
-async def logout_all(
+def logout_all(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
@@ -243,13 +278,13 @@ async def logout_all(
 # ==================== USER MANAGEMENT ====================
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_user)):
+def get_current_user_info(current_user: User = Depends(get_current_user)):
     """Get current user information"""
     return current_user
 
 
 @router.put("/me", response_model=UserResponse)
-async def update_current_user(
+def update_current_user(
     user_data: UserUpdate,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -260,9 +295,10 @@ async def update_current_user(
     if user_data.bio is not None:
         current_user.bio = user_data.bio
     if user_data.phone_number is not None:
-        # Check if phone number is already used by another user
-        existing = db.query(User).filter(
-            User.phone_number == user_data.phone_number,
+        # Check if phone number is already used by another user, in any format
+        normalized = normalize_phone(user_data.phone_number)
+        existing = normalized is not None and db.query(User.id).filter(
+            User.phone_normalized == normalized,
             User.id != current_user.id
         ).first()
         if existing:
@@ -285,15 +321,16 @@ class PhoneUpdateRequest(BaseModel):
 
 
 @router.put("/me/phone", response_model=UserResponse)
-async def update_phone_number(
+def update_phone_number(
     phone_data: PhoneUpdateRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Update current user's phone number"""
-    # Check if phone number is already used by another user
-    existing = db.query(User).filter(
-        User.phone_number == phone_data.phone_number,
+    # Check if phone number is already used by another user, in any format
+    normalized = normalize_phone(phone_data.phone_number)
+    existing = normalized is not None and db.query(User.id).filter(
+        User.phone_normalized == normalized,
         User.id != current_user.id
     ).first()
     if existing:
@@ -312,7 +349,7 @@ async def update_phone_number(
 
 
 @router.put("/me/password")
-async def change_password(
+def change_password(
     password_data: ChangePasswordRequest,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -326,32 +363,50 @@ async def change_password(
     
     current_user.hashed_password = get_password_hash(password_data.new_password)
     db.commit()
+    invalidate_cached_user(current_user.id)
     
     return {"message": "Password changed successfully"}
 
 
 # ==================== USER CRUD (Admin) ====================
 
-@router.get("/users", response_model=list[UserResponse])
-async def list_users(
+@router.get("/users")
+def list_users(
     skip: int = 0,
     limit: int = 100,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """List all users (superuser only)"""
-    users = db.query(User).offset(skip).limit(limit).all()
-    return users
+    query = select(*_USER_COLUMNS).order_by(User.id).offset(skip).limit(limit)
+    bind = db.get_bind()
+    
+    # Serialize batch by batch while rows are fetched, instead of holding the
+    # whole page and its JSON in memory at once. The body is sent after the
+    # request's session may already be closed, so the generator owns its session
+    def stream_users():
+        with SessionLocal(bind=bind) as stream_db:
+            result = stream_db.execute(query.execution_options(yield_per=LIST_STREAM_BATCH_SIZE))
+            yield b"["
+            separator = b""
+            for batch in result.partitions():
+                yield separator + b",".join(
+                    UserResponse.model_validate(row).model_dump_json().encode() for row in batch
+                )
+                separator = b","
+            yield b"]"
+    
+    return StreamingResponse(stream_users(), media_type="application/json")
 
 
 @router.get("/users/{user_id}", response_model=UserResponse)
-async def get_user(
+def get_user(
     user_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Get a specific user (superuser only)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -361,28 +416,12 @@ async def get_user(
 
 
 @router.post("/users", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def create_user(
+def create_user(
     user_data: UserCreate,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Create a new user (superuser only)"""
-    # Check if username exists
-    existing_user = db.query(User).filter(User.username == user_data.username).first()
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Username already registered"
-        )
-    
-    # Check if email exists
-    existing_email = db.query(User).filter(User.email == user_data.email).first()
-    if existing_email:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Email already registered"
-        )
-    
     user = User(
         username=user_data.username,
         email=user_data.email,
@@ -391,17 +430,24 @@ async def create_user(
         phone_number=user_data.phone_number
     )
     
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+    except IntegrityError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=_duplicate_user_detail(e)
+        )
     
     return user
 
 
 @router.delete("/users/{user_id}")
-async def delete_user(
+def delete_user(
     user_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Delete a user (superuser only)"""
@@ -411,7 +457,7 @@ async def delete_user(
             detail="Cannot delete your own account"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -420,14 +466,15 @@ async def delete_user(
     
     db.delete(user)
     db.commit()
+    invalidate_cached_user(user_id)
     
     return {"message": "User deleted successfully"}
 
 
 @router.put("/users/{user_id}/disable")
-async def disable_user(
+def disable_user(
     user_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Disable a user (superuser only)"""
@@ -437,7 +484,7 @@ async def disable_user(
             detail="Cannot disable your own account"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -446,18 +493,19 @@ async def disable_user(
     
     user.is_active = False
     db.commit()
+    invalidate_cached_user(user_id)
     
     return {"message": "User disabled successfully"}
 
 
 @router.put("/users/{user_id}/enable")
-async def enable_user(
+def enable_user(
     user_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Enable a user (superuser only)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -466,15 +514,16 @@ async def enable_user(
     
     user.is_active = True
     db.commit()
+    invalidate_cached_user(user_id)
     
     return {"message": "User enabled successfully"}
 
 
 @router.put("/users/{user_id}/superuser")
-async def toggle_superuser(
+def toggle_superuser(
     user_id: int,
     is_superuser: bool,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Toggle superuser status (superuser only)"""
@@ -484,7 +533,7 @@ async def toggle_superuser(
             detail="Cannot change your own superuser status"
         )
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -493,6 +542,7 @@ async def toggle_superuser(
     
     user.is_superuser = is_superuser
     db.commit()
+    invalidate_cached_user(user_id)
     
     return {"message": f"User superuser status set to {is_superuser}"}
 
@@ -500,12 +550,12 @@ async def toggle_superuser(
 # ==================== SESSIONS ====================
 
 @router.get("/sessions", response_model=list[SessionResponse])
-async def list_sessions(
+def list_sessions(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """List all sessions for current user"""
-    sessions = db.query(UserSession).filter(
+    sessions = db.query(*_SESSION_COLUMNS).filter(
         UserSession.user_id == current_user.id,
         UserSession.is_active == True
     ).all()
@@ -513,7 +563,7 @@ async def list_sessions(
 
 
 @router.delete("/sessions/{session_id}")
-async def delete_session(
+def delete_session(
     session_id: int,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -539,19 +589,19 @@ async def delete_session(
 # ==================== ROLES ====================
 
 @router.get("/roles", response_model=list[RoleResponse])
-async def list_roles(
-    current_user: User = Depends(require_superuser),
+def list_roles(
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """List all roles (superuser only)"""
-    roles = db.query(Role).all()
+    roles = db.query(*_ROLE_COLUMNS).all()
     return roles
 
 
 @router.post("/roles", response_model=RoleResponse, status_code=status.HTTP_201_CREATED)
-async def create_role(
+def create_role(
     role_data: RoleCreate,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Create a new role (superuser only)"""
@@ -575,9 +625,9 @@ async def create_role(
 
 
 @router.delete("/roles/{role_id}")
-async def delete_role(
+def delete_role(
     role_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Delete a role (superuser only)"""
@@ -595,14 +645,14 @@ async def delete_role(
 
 
 @router.put("/users/{user_id}/roles")
-async def assign_roles(
+def assign_roles(
     user_id: int,
     role_data: UserRoleAssign,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Assign roles to a user (superuser only)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -612,12 +662,16 @@ async def assign_roles(
     # Remove existing roles
     db.query(UserRole).filter(UserRole.user_id == user_id).delete()
     
-    # Add new roles
-    for role_id in role_data.role_ids:
-        role = db.query(Role).filter(Role.id == role_id).first()
-        if role:
-            user_role = UserRole(user_id=user_id, role_id=role_id)
-            db.add(user_role)
+    # Add new roles: validate all ids in one SELECT, then one bulk INSERT
+    valid_ids = {
+        role_id for (role_id,) in db.query(Role.id).filter(Role.id.in_(role_data.role_ids))
+    }
+    role_ids = [role_id for role_id in dict.fromkeys(role_data.role_ids) if role_id in valid_ids]
+    if role_ids:
+        db.execute(
+            insert(UserRole),
+            [{"user_id": user_id, "role_id": role_id} for role_id in role_ids]
+        )
     
     db.commit()
     
@@ -625,21 +679,22 @@ async def assign_roles(
 
 
 @router.get("/users/{user_id}/roles", response_model=list[RoleResponse])
-async def get_user_roles(
+def get_user_roles(
     user_id: int,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Get roles for a specific user (superuser only)"""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    user_roles = db.query(UserRole).filter(UserRole.user_id == user_id).all()
-    roles = [ur.role for ur in user_roles if ur.role]
+    roles = db.query(Role).join(
+        UserRole, UserRole.role_id == Role.id
+    ).filter(UserRole.user_id == user_id).all()
     
     return roles
 
@@ -647,61 +702,67 @@ async def get_user_roles(
 # ==================== CONVERSATIONS ====================
 
 @router.get("/conversations", response_model=list[ConversationResponse])
-async def get_conversations(
+def get_conversations(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Get all conversations for the current user"""
-    # Get all unique conversation IDs where user is sender or recipient
-    conversations = db.query(
+    user_id = current_user.id
+    
+    # Rank each conversation's messages newest-first and total the unread ones,
+    # so the latest message, other user and unread count come from one query
+    ranked = db.query(
+        Message.id,
         Message.conversation_id,
-        func.max(Message.created_at).label('last_message_at')
+        Message.sender_id,
+        Message.recipient_id,
+        Message.content,
+        Message.created_at,
+        func.row_number().over(
+            partition_by=Message.conversation_id,
+            order_by=(Message.created_at.desc(), Message.id.desc())
+        ).label("rn"),
+        func.sum(
+            case((and_(Message.recipient_id == user_id, Message.is_read == False), 1), else_=0)
+        ).over(partition_by=Message.conversation_id).label("unread_count")
     ).filter(
-        (Message.sender_id == current_user.id) | (Message.recipient_id == current_user.id)
-    ).group_by(Message.conversation_id).all()
-    
-    result = []
-    for conv in conversations:
-        # Get the last message in this conversation
-        last_msg = db.query(Message).filter(
-            Message.conversation_id == conv.conversation_id
-        ).order_by(Message.created_at.desc()).first()
-        
-        if not last_msg:
-            continue
-        
-        # Determine the other user
-        if last_msg.sender_id == current_user.id:
-            other_user_id = last_msg.recipient_id
-        else:
-            other_user_id = last_msg.sender_id
-        
-        other_user = db.query(User).filter(User.id == other_user_id).first()
-        other_user_name = other_user.username if other_user else "Unknown"
-        
-        # Count unread messages
-        unread_count = db.query(Message).filter(
-            Message.conversation_id == conv.conversation_id,
-            Message.recipient_id == current_user.id,
-            Message.is_read == False
-        ).count()
-        
-        result.append(ConversationResponse(
-            conversation_id=conv.conversation_id,
-            other_user_id=other_user_id,
-            other_user_name=other_user_name,
-            last_message=last_msg.content[:100] if last_msg.content else "",
-            last_message_at=last_msg.created_at,
-            unread_count=unread_count
-        ))
-    
-    # Sort by last message time, most recent first
-    result.sort(key=lambda x: x.last_message_at, reverse=True)
-    return result
+        (Message.sender_id == user_id) | (Message.recipient_id == user_id),
+        Message.conversation_id.isnot(None)
+    ).subquery()
+    
+    other_user_id = case(
+        (ranked.c.sender_id == user_id, ranked.c.recipient_id),
+        else_=ranked.c.sender_id
+    ).label("other_user_id")
+    
+    rows = db.query(
+        ranked.c.conversation_id,
+        other_user_id,
+        User.username,
+        ranked.c.content,
+        ranked.c.created_at,
+        ranked.c.unread_count
+    ).outerjoin(
+        User, User.id == other_user_id
+    ).filter(
+        ranked.c.rn == 1
+    ).order_by(ranked.c.created_at.desc(), ranked.c.id.desc()).all()
+    
+    return [
+        ConversationResponse(
+            conversation_id=row.conversation_id,
+            other_user_id=row.other_user_id,
+            other_user_name=row.username or "Unknown",
+            last_message=row.content[:100] if row.content else "",
+            last_message_at=row.created_at,
+            unread_count=row.unread_count or 0
+        )
+        for row in rows
+    ]
 
 
 @router.get("/conversations/{conversation_id}/messages", response_model=list[MessageResponse])
-async def get_conversation_messages(
+def get_conversation_messages(
     conversation_id: str,
     skip: int = 0,
     limit: int = 100,
@@ -709,17 +770,20 @@ async def get_conversation_messages(
     db: Session = Depends(get_db)
 ):
     """Get messages for a specific conversation"""
-    # Verify user is part of this conversation
-    messages = db.query(Message).filter(
+    # Verify user is part of this conversation; the inner query pages from the
+    # newest message back, the outer one returns that page in chronological order
+    page = db.query(Message).filter(
         Message.conversation_id == conversation_id,
         ((Message.sender_id == current_user.id) | (Message.recipient_id == current_user.id))
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Message.created_at.desc(), Message.id.desc()).offset(skip).limit(limit).subquery()
+    recent = aliased(Message, page)
     
-    return messages[::-1]  # Reverse to get chronological order
+    messages = db.query(recent).order_by(recent.created_at, recent.id).all()
+    return messages
 
 
 @router.post("/conversations/{conversation_id}/messages", response_model=MessageResponse)
-async def send_message(
+def send_message(
     conversation_id: str,
     message_data: MessageCreate,
     current_user: User = Depends(get_current_user),
@@ -727,7 +791,7 @@ async def send_message(
 ):
     """Send a message in a conversation"""
     # Verify recipient exists
-    recipient = db.query(User).filter(User.id == message_data.recipient_id).first()
+    recipient = db.get(User, message_data.recipient_id)
     if not recipient:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -749,7 +813,7 @@ async def send_message(
 
 
 @router.put("/conversations/{conversation_id}/read")
-async def mark_conversation_read(
+def mark_conversation_read(
     conversation_id: str,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
@@ -1,7 +1,14 @@
 from datetime import datetime, timedelta
-from typing import Optional
-import secrets
+from typing import NamedTuple, Optional
+import base64
+import hashlib
+import hmac
+import os
+import threading
+import time
 import bcrypt
+import orjson
+from cachetools import TTLCache
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -15,25 +22,87 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_DAYS = 7
 
+# bcrypt work factor; hashes with another cost or ident are upgraded at login
+BCRYPT_ROUNDS = 12
+BCRYPT_IDENT = b"2b"
+
+# Verified token cache: repeated requests with the same bearer token skip
+# signature verification for up to one access-token lifetime, and never past
+# the token's own exp
+TOKEN_CACHE_MAXSIZE = 10000
+TOKEN_CACHE_TTL_SECONDS = ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+# Login throttling: failed attempts per (client ip, username); the counter
+# resets once no failure has been recorded for the whole window
+LOGIN_MAX_FAILED_ATTEMPTS = 5
+LOGIN_THROTTLE_WINDOW_SECONDS = 60
+
+# Cached (is_active, username, is_superuser) per user id for routes that only
+# need the caller's identity; admin changes to a user evict its entry
+USER_CACHE_TTL_SECONDS = 30
+
+# jwt.decode arguments, built once instead of per call
+_JWT_ALGORITHMS = (ALGORITHM,)
+_JWT_OPTIONS = {"verify_signature": True, "verify_exp": True, "verify_aud": False}
+
+# HS256 fast path: plain tokens with only the claims issued here are verified
+# with hmac.digest (single-shot OpenSSL HMAC); anything else goes through jose
+_SECRET_KEY_BYTES = SECRET_KEY.encode("utf-8")
+_FAST_PATH_CLAIMS = frozenset({"sub", "username", "exp", "type", "is_superuser"})
+_JOSE_FALLBACK = object()
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 oauth2_scheme_refresh = OAuth2PasswordBearer(tokenUrl="auth/refresh", auto_error=False)
 
+# token digest -> (payload, cache expiry timestamp); failed verifications are never cached
+_token_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=TOKEN_CACHE_TTL_SECONDS)
+_token_cache_lock = threading.Lock()
+
+# bcrypt releases the GIL, so hashes already run in parallel on the threadpool
+# handlers execute in. Cap concurrent hashes at the core count so a burst of
+# logins cannot oversubscribe the CPU and starve the rest of the threadpool.
+_hash_slots = threading.BoundedSemaphore(os.cpu_count() or 1)
+
+# user id -> (is_active, username, is_superuser)
+_user_cache = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=USER_CACHE_TTL_SECONDS)
+_user_cache_lock = threading.Lock()
+
+# (client ip, username) -> consecutive failed login attempts
+_failed_logins = TTLCache(maxsize=TOKEN_CACHE_MAXSIZE, ttl=LOGIN_THROTTLE_WINDOW_SECONDS)
+_failed_logins_lock = threading.Lock()
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
-    return bcrypt.checkpw(
-        plain_password.encode('utf-8'),
-        hashed_password.encode('utf-8')
-    )
+    with _hash_slots:
+        return bcrypt.checkpw(
+            plain_password.encode('utf-8'),
+            hashed_password.encode('utf-8')
+        )
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password"""
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS, prefix=BCRYPT_IDENT)
+    with _hash_slots:
+        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
 
-def create_access_token(user_id: int, username: str, expires_delta: Optional[timedelta] = None) -> str:
+def needs_rehash(hashed_password: str) -> bool:
+    """Check whether a hash was made with other bcrypt settings than the current ones"""
+    # Modular crypt format: $<ident>$<cost>$<salt+hash>
+    parts = hashed_password.split("$")
+    if len(parts) != 4:
+        return True
+    return parts[1] != BCRYPT_IDENT.decode() or parts[2] != f"{BCRYPT_ROUNDS:02d}"
+
+
+def create_access_token(
+    user_id: int,
+    username: str,
+    expires_delta: Optional[timedelta] = None,
+    is_superuser: bool = False
+) -> str:
     """Create an access token"""
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -44,7 +113,8 @@ def create_access_token(user_id: int, username: str, expires_delta: Optional[tim
         "sub": str(user_id),
         "username": username,
         "exp": expire,
-        "type": "access"
+        "type": "access",
+        "is_superuser": is_superuser
     }
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
@@ -63,21 +133,104 @@ def create_refresh_token(user_id: int, username: str) -> str:
     return encoded_jwt
 
 
-def decode_token(token: str) -> Optional[dict]:
-    """Decode and validate a JWT token"""
+def _token_cache_key(token: str) -> bytes:
+    """Cache key for a raw token (truncated SHA-256 digest)"""
+    return hashlib.sha256(token.encode()).digest()[:16]
+
+
+def _b64url_decode(segment: str) -> bytes:
+    """Decode an unpadded base64url JWT segment"""
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+
+def _decode_hs256(token: str):
+    """Verify a token issued by this module with one OpenSSL HMAC call.
+
+    Returns the payload, None for an invalid token, or _JOSE_FALLBACK when the
+    token carries headers or claims that only jose knows how to validate.
+    """
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload
-    except JWTError:
+        header_b64, payload_b64, signature_b64 = token.split(".")
+        header = orjson.loads(_b64url_decode(header_b64))
+        if not isinstance(header, dict) or header.get("alg") != ALGORITHM or header.keys() - {"alg", "typ"}:
+            return _JOSE_FALLBACK
+        
+        expected = hmac.digest(_SECRET_KEY_BYTES, f"{header_b64}.{payload_b64}".encode("ascii"), "sha256")
+        if not hmac.compare_digest(expected, _b64url_decode(signature_b64)):
+            return None
+        
+        payload = orjson.loads(_b64url_decode(payload_b64))
+    except ValueError:
         return None
+    
+    if not isinstance(payload, dict) or payload.keys() - _FAST_PATH_CLAIMS:
+        return _JOSE_FALLBACK
+    exp = payload.get("exp")
+    if exp is not None and (not isinstance(exp, int) or exp < int(time.time())):
+        return None
+    return payload
+
+
+def decode_token(token: str) -> Optional[dict]:
+    """Decode and validate a JWT token (verified payloads are cached until exp)"""
+    key = _token_cache_key(token)
+    now = time.time()
+    with _token_cache_lock:
+        cached = _token_cache.get(key)
+    if cached is not None and cached[1] > now:
+        return cached[0]
+
+    payload = _decode_hs256(token)
+    if payload is _JOSE_FALLBACK:
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=_JWT_ALGORITHMS, options=_JWT_OPTIONS)
+        except JWTError:
+            return None
+    if payload is None:
+        return None
+
+    expires_at = min(payload.get("exp", now), now + TOKEN_CACHE_TTL_SECONDS)
+    if expires_at > now:
+        with _token_cache_lock:
+            _token_cache[key] = (payload, expires_at)
+    return payload
+
+
+def invalidate_cached_user(user_id: int) -> None:
+    """Drop the cached auth state of a user after it changes"""
+    with _user_cache_lock:
+        _user_cache.pop(int(user_id), None)
+
+
+def is_login_throttled(client_ip: Optional[str], username: str) -> bool:
+    """Check whether a client has exhausted its failed login attempts for a username"""
+    with _failed_logins_lock:
+        return _failed_logins.get((client_ip, username), 0) >= LOGIN_MAX_FAILED_ATTEMPTS
+
+
+def record_failed_login(client_ip: Optional[str], username: str) -> None:
+    """Count a failed login attempt"""
+    key = (client_ip, username)
+    with _failed_logins_lock:
+        _failed_logins[key] = _failed_logins.get(key, 0) + 1
+
+
+def clear_failed_logins(client_ip: Optional[str], username: str) -> None:
+    """Reset the failed login counter after a successful login"""
+    with _failed_logins_lock:
+        _failed_logins.pop((client_ip, username), None)
+
+
+_urlsafe_b64encode = base64.urlsafe_b64encode
 
 
 def generate_session_token() -> str:
     """Generate a secure session token"""
-    return secrets.token_urlsafe(32)
+    # Same output as secrets.token_urlsafe(32), without the secrets wrapper
+    return _urlsafe_b64encode(os.urandom(32)).rstrip(b"=").decode("ascii")
 
 
-async def get_current_user(
+def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ) -> User:
@@ -92,11 +245,11 @@ async def get_current_user(
     if payload is None or payload.get("type") != "access":
         raise credentials_exception
     
-    user_id: int = payload.get("sub")
+    user_id = payload.get("sub")
     if user_id is None:
         raise credentials_exception
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, int(user_id))
     if user is None:
         raise credentials_exception
     
@@ -109,7 +262,7 @@ async def get_current_user(
     return user
 
 
-async def get_current_user_optional(
+def get_current_user_optional(
     token: Optional[str] = Depends(oauth2_scheme_refresh),
     db: Session = Depends(get_db)
 ) -> Optional[User]:
@@ -121,22 +274,73 @@ async def get_current_user_optional(
     if payload is None or payload.get("type") != "access":
         return None
     
-    user_id: int = payload.get("sub")
+    user_id = payload.get("sub")
     if user_id is None:
         return None
     
-    user = db.query(User).filter(User.id == user_id).first()
+    user = db.get(User, int(user_id))
     if user is None or not user.is_active:
         return None
     
     return user
 
 
-def require_superuser(user: User = Depends(get_current_user)) -> User:
+class TokenUser(NamedTuple):
+    """Lightweight authenticated principal without ORM state"""
+    id: int
+    username: str
+    is_superuser: bool
+
+
+def get_current_principal(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> TokenUser:
+    """Get the current user's identity, hitting the database only on a cache miss"""
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    
+    payload = decode_token(token)
+    if payload is None or payload.get("type") != "access" or payload.get("sub") is None:
+        raise credentials_exception
+    
+    user_id = int(payload["sub"])
+    with _user_cache_lock:
+        cached = _user_cache.get(user_id)
+    if cached is None:
+        user = db.get(User, user_id)
+        if user is None:
+            raise credentials_exception
+        cached = (user.is_active, user.username, user.is_superuser)
+        with _user_cache_lock:
+            _user_cache[user_id] = cached
+    
+    is_active, username, is_superuser = cached
+    if not is_active:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is disabled"
+        )
+    
+    return TokenUser(user_id, username, is_superuser)
+
+
+def require_superuser(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> TokenUser:
     """Require superuser access"""
+    # The role comes from the database, never the token claim. The principal is
+    # cached per process for USER_CACHE_TTL_SECONDS and invalidate_cached_user
+    # only clears the worker that made the change, so with AI_MESSAGE_WORKERS>1
+    # a disabled or demoted admin can keep access on other workers until expiry
+    user = get_current_principal(token, db)
     if not user.is_superuser:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Superuser access required"
         )
-    return user
\ No newline at end of file
+    return user
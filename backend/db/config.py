@@ -1,26 +1,78 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 
 from dotenv import load_dotenv
-load_dotenv()
+
+def load_env():
+    """Load .env once per process, and never in production where configuration comes from the real environment."""
+    if os.getenv("AI_MESSAGE_ENV") != "production" and not os.getenv("AI_MESSAGE_ENV_LOADED"):
+        load_dotenv()
+        os.environ["AI_MESSAGE_ENV_LOADED"] = "1"
+
+
+load_env()
 
 # Database URL from environment variable
 DATABASE_URL = os.getenv(
     "AI_MESSAGE_DATABASE_URL", "sqlite:///./backend/dev.db"  # Default to local SQLite for development
 )
 
+# Connection pool settings; pool size plus overflow should cover the request
+# threadpool (AI_MESSAGE_THREADPOOL_SIZE) so threads don't time out waiting
+DB_POOL_SIZE = int(os.getenv("AI_MESSAGE_DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("AI_MESSAGE_DB_MAX_OVERFLOW", "40"))
+DB_POOL_TIMEOUT = int(os.getenv("AI_MESSAGE_DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("AI_MESSAGE_DB_POOL_RECYCLE", "1800"))
+
+# Compiled SQL cache entries per engine (SQLAlchemy defaults to 500)
+DB_QUERY_CACHE_SIZE = int(os.getenv("AI_MESSAGE_DB_QUERY_CACHE_SIZE", "1200"))
+
+# Bytes of the SQLite file to memory-map for reads
+SQLITE_MMAP_SIZE = int(os.getenv("AI_MESSAGE_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
 # For SQLite, we need to add check_same_thread=False for async support
 if DATABASE_URL.startswith("sqlite"):
+    # File databases get a QueuePool sized like PostgreSQL's (the default of
+    # 5 + 10 runs dry under the request threadpool); in-memory databases use
+    # a single-connection pool that takes no sizing arguments
+    in_memory = make_url(DATABASE_URL).database in (None, "", ":memory:")
+    pool_args = {} if in_memory else {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
     engine = create_engine(
         DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        connect_args={"check_same_thread": False},
+        query_cache_size=DB_QUERY_CACHE_SIZE,
+        **pool_args
     )
+
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL so readers never block the writer and commits skip most fsyncs"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.close()
 else:
-    # PostgreSQL or other databases
-    engine = create_engine(DATABASE_URL)
+    # PostgreSQL or other databases: keep a warm pool of validated connections
+    engine = create_engine(
+        DATABASE_URL,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        query_cache_size=DB_QUERY_CACHE_SIZE
+    )
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# expire_on_commit=False keeps loaded attributes after commit, so serializing a
+# just-committed object does not issue a fresh SELECT per instance
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
 
 Base = declarative_base()
 
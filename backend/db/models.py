@@ -1,16 +1,44 @@
-from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
-from sqlalchemy.orm import relationship
+import re
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Index, func
+from sqlalchemy.orm import relationship, validates
 from .config import Base
 
 
+_NON_DIGITS = re.compile(r"\D")
+
+# Trailing digits compared when an incoming number has no exact match, so a
+# missing or extra country code still resolves
+PHONE_MATCH_SUFFIX_DIGITS = 10
+
+
+def normalize_phone(value):
+    """Digits-only form of a phone number, or None when it has no digits"""
+    if not value:
+        return None
+    return _NON_DIGITS.sub("", value) or None
+
+
+def phone_suffix(normalized):
+    """Trailing digits of a normalized number, or None when it is too short to match on"""
+    if not normalized or len(normalized) < PHONE_MATCH_SUFFIX_DIGITS:
+        return None
+    return normalized[-PHONE_MATCH_SUFFIX_DIGITS:]
+
+
 class BaseModel(Base):
     """Base model with common fields for all tables"""
     __abstract__ = True
     
-    id = Column(Integer, primary_key=True, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    # The primary key is already indexed; an extra ix_<table>_id index only
+    # adds write overhead
+    id = Column(Integer, primary_key=True)
+    # Timestamps are set by the database; eager_defaults reads them back in the
+    # same INSERT/UPDATE (RETURNING) instead of a later SELECT. They stay naive
+    # UTC like every other datetime column, so the database session must run in UTC
+    created_at = Column(DateTime(), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(), server_default=func.now(), onupdate=func.now(), nullable=False)
+    
+    __mapper_args__ = {"eager_defaults": True}
 
 
 class User(BaseModel):
@@ -27,6 +55,11 @@ class User(BaseModel):
     full_name = Column(String(255), nullable=True)
     bio = Column(Text, nullable=True)
     phone_number = Column(String(20), unique=True, index=True, nullable=True)
+    # Digits-only copy of phone_number, kept in sync for indexed lookups
+    phone_normalized = Column(String(20), unique=True, index=True, nullable=True)
+    # Last PHONE_MATCH_SUFFIX_DIGITS of phone_normalized; not unique, since
+    # numbers under different country codes can share it
+    phone_suffix = Column(String(PHONE_MATCH_SUFFIX_DIGITS), index=True, nullable=True)
     
     # Session relationship
     sessions = relationship("Session", back_populates="user", cascade="all, delete-orphan")
@@ -35,6 +68,13 @@ class User(BaseModel):
     
     # Reports relationship - user as reporter
     reports = relationship("Report", back_populates="reporter", cascade="all, delete-orphan", foreign_keys="Report.reporter_id")
+    
+    @validates("phone_number")
+    def _sync_phone_normalized(self, key, value):
+        """Keep phone_normalized and phone_suffix in step with phone_number"""
+        self.phone_normalized = normalize_phone(value)
+        self.phone_suffix = phone_suffix(self.phone_normalized)
+        return value
 
 
 class Role(BaseModel):
@@ -56,7 +96,7 @@ class UserRole(BaseModel):
     role_id = Column(Integer, ForeignKey("roles.id", ondelete="CASCADE"), nullable=False)
     
     user = relationship("User", back_populates="user_roles")
-    role = relationship("Role", back_populates="user_roles")
+    role = relationship("Role", back_populates="user_roles", lazy="selectin")
 
 
 class Session(BaseModel):
@@ -71,6 +111,11 @@ class Session(BaseModel):
     expires_at = Column(DateTime, nullable=False)
     
     user = relationship("User", back_populates="sessions")
+    
+    __table_args__ = (
+        # Active-session listing and logout-all filter on both columns
+        Index("ix_sessions_user_active", "user_id", "is_active"),
+    )
 
 
 class RefreshToken(BaseModel):
@@ -81,7 +126,6 @@ class RefreshToken(BaseModel):
     token = Column(String(255), unique=True, index=True, nullable=False)
     expires_at = Column(DateTime, nullable=False)
     is_used = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
     user = relationship("User", back_populates="refresh_tokens")
 
@@ -90,14 +134,31 @@ class Message(BaseModel):
     """Message model - compatible with SQLite and PostgreSQL"""
     __tablename__ = "messages"
     
-    sender_id = Column(Integer, index=True, nullable=False)
-    recipient_id = Column(Integer, index=True, nullable=False)
+    # Indexed through the leading columns of ix_messages_sender_created and
+    # ix_messages_recipient_created
+    sender_id = Column(Integer, nullable=False)
+    recipient_id = Column(Integer, nullable=False)
     content = Column(Text, nullable=False)
     is_read = Column(Boolean, default=False)
     
     # Optional: for message threading
     parent_id = Column(Integer, nullable=True)
-    conversation_id = Column(String(100), index=True, nullable=True)
+    # Indexed through the leading column of ix_messages_conversation_created
+    conversation_id = Column(String(100), nullable=True)
+    
+    __table_args__ = (
+        # Latest messages of a conversation without a separate sort
+        Index("ix_messages_conversation_created", "conversation_id", "created_at"),
+        # Sent/received/inbox pages, newest first, straight off the index
+        Index("ix_messages_sender_created", "sender_id", "created_at"),
+        Index("ix_messages_recipient_created", "recipient_id", "created_at"),
+        # Unread lookups only ever touch the (small) unread subset
+        Index(
+            "ix_messages_recipient_unread", "recipient_id",
+            postgresql_where=(is_read == False),
+            sqlite_where=(is_read == False)
+        ),
+    )
 
 
 class Report(BaseModel):
@@ -15,11 +15,14 @@ To add a new logger:
 
 Log files are stored in: logs/ (configurable via AI_MESSAGE_LOGS_FOLDER env var)
 Log format: "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-Log rotation: 1MB per file, 50 backup files (50MB total)
+Log rotation: 16MB per file, 5 backup files (96MB total)
+Log writes: records are queued and written to disk by a background thread
 """
 import os
+import atexit
+import queue
 import logging
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 # Get the logs folder path from environment or use default
 logs_folder = os.getenv("AI_MESSAGE_LOGS_FOLDER", "logs")
@@ -27,11 +30,27 @@ backend_dir = os.path.dirname(os.path.abspath(__file__))
 logs_path = os.path.join(backend_dir, "..", logs_folder)
 os.makedirs(logs_path, exist_ok=True)
 
+# One background writer per log file; stopped (and drained) at exit
+_listeners: list[QueueListener] = []
+
+
+@atexit.register
+def _stop_listeners() -> None:
+    """Flush queued records, stop the writer threads and close the log files"""
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
 
 def setup_logger(name: str, log_file: str, level: int = logging.INFO) -> logging.Logger:
     """
     Set up a logger with a rotating file handler.
     
+    The logger itself only enqueues records; a QueueListener thread owns the
+    file handler, so rotation and disk writes never block the caller.
+    
     Args:
         name: Logger name
         log_file: Name of the log file
@@ -41,18 +60,30 @@ def setup_logger(name: str, log_file: str, level: int = logging.INFO) -> logging
         Configured logger instance
     """
     logger = logging.getLogger(name)
+    # Already configured (module imported under another path, or reloaded):
+    # adding a second handler would write every record twice
+    if logger.handlers:
+        return logger
     logger.setLevel(level)
     
-    # Rotating file handler: max 50MB total (50 files x 1MB each)
+    # Rotating file handler: max 96MB total (6 files x 16MB each)
     handler = RotatingFileHandler(
         os.path.join(logs_path, log_file),
-        maxBytes=1 * 1024 * 1024,  # 1MB per file
-        backupCount=50  # 50 files = 50MB max
+        maxBytes=16 * 1024 * 1024,  # 16MB per file
+        backupCount=5  # 6 files = 96MB max
     )
     handler.setFormatter(logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     ))
-    logger.addHandler(handler)
+    
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+    logger.addHandler(QueueHandler(log_queue))
+    
+    # Records are written by this handler only, not formatted again by root
+    logger.propagate = False
     
     return logger
 
@@ -1,19 +1,24 @@
+import logging
 import os
 import sys
-import json
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, Depends, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, PlainTextResponse
+from functools import lru_cache
+import anyio.to_thread
+import orjson
+from fastapi import FastAPI, Depends, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
+from fastapi.middleware.gzip import GZipMiddleware
 import uvicorn
 from sqlalchemy.orm import Session
 
 # Add the backend directory to the path for imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from db.config import get_db, engine
-from db.models import Base, User, Message
+from db.config import get_db, engine, SessionLocal, load_env
+from db.models import Base, User, Message, normalize_phone, phone_suffix
 from auth.router import router as auth_router
 from messages.router import router as messages_router
 from reports.router import router as reports_router
@@ -35,19 +40,41 @@ from init_logs import auth_logger, twilio_logger
 #   - orchestrator_logger -> logs/orchestrator.log (AI orchestration)
 # =============================================================================
 
-load_dotenv()
-
-# Create tables on startup
-Base.metadata.create_all(bind=engine)
+# Load .env before the orchestrator reads its configuration
+load_env()
 
 # Setup AI orchestrator
-from orchestrator import setup_orchestrator
+from orchestrator import setup_orchestrator, submit_ai_task, shutdown_ai_tasks
 setup_orchestrator()
 
+# Database module logger
+db_logger = logging.getLogger("db")
+
+# Worker threads for sync handlers and run_in_threadpool calls (anyio defaults to 40)
+THREADPOOL_SIZE = int(os.getenv("AI_MESSAGE_THREADPOOL_SIZE", "64"))
+
+# Create missing tables at startup instead of relying on `alembic upgrade head`
+AUTO_CREATE_TABLES = os.getenv("AI_MESSAGE_AUTO_CREATE_TABLES") == "1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_SIZE
+    # Schema is managed by Alembic; create_all is an opt-in shortcut for
+    # throwaway development databases
+    if AUTO_CREATE_TABLES:
+        Base.metadata.create_all(bind=engine)
+    yield
+    # Let queued AI replies finish before the process exits
+    shutdown_ai_tasks()
+
+
 app = FastAPI(
     title="AI Message API",
     description="Authentication and user management API",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware
@@ -59,6 +86,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress large JSON list responses (users, sessions, conversations, messages)
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Include auth router
 app.include_router(auth_router)
 
@@ -68,17 +98,24 @@ app.include_router(messages_router)
 # Include reports router
 app.include_router(reports_router)
 
+# Static bodies for the root and health endpoints, serialized once at import
+# so frequent load balancer probes skip JSON encoding
+_ROOT_BODY = orjson.dumps({"message": "Hello World", "docs": "/docs"})
+_HEALTH_BODY = orjson.dumps({"status": "healthy"})
+
 @app.get("/")
 async def root():
-    return {"message": "Hello World", "docs": "/docs"}
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy"}
+    return Response(content=_HEALTH_BODY, media_type="application/json")
 
-# Example endpoint with database dependency
+# Example endpoint with database dependency; pool status goes to the log only,
+# since this endpoint is unauthenticated
 @app.get("/db-test")
-async def db_test(db: Session = Depends(get_db)):
+def db_test(db: Session = Depends(get_db)):
+    db_logger.info("Connection pool: %s", engine.pool.status())
     return {"status": "database connection working"}
 
 
@@ -90,23 +127,19 @@ def process_ai_response_task(user_id: int, message_content: str, conversation_id
     Sends the AI response back to the appropriate channel.
     """
     from orchestrator import get_orchestrator
-    from sqlalchemy.orm import Session
-    from db.config import get_db
-    from db.models import Message
 
     try:
-        twilio_logger.info(f"[BackgroundTask] Processing AI response for user {user_id} via {channel} (whatsapp={is_whatsapp})")
+        twilio_logger.info("[BackgroundTask] Processing AI response for user %s via %s (whatsapp=%s)", user_id, channel, is_whatsapp)
 
         # Get orchestrator
         orchestrator = get_orchestrator()
 
         # Get AI response
         ai_response = orchestrator.process_message(user_id, message_content)
-        twilio_logger.info(f"[BackgroundTask] AI response generated: {ai_response[:100]}...")
+        twilio_logger.info("[BackgroundTask] AI response generated: %.100s...", ai_response)
 
         # Save AI response as a new message
-        db: Session = next(get_db())
-        try:
+        with SessionLocal() as db:
             ai_message = Message(
                 sender_id=-1,  # AI bot user ID
                 recipient_id=user_id,
@@ -116,47 +149,33 @@ def process_ai_response_task(user_id: int, message_content: str, conversation_id
             )
             db.add(ai_message)
             db.commit()
-            twilio_logger.info(f"[BackgroundTask] AI message saved: {ai_message.id}")
-        finally:
-            db.close()
+            twilio_logger.info("[BackgroundTask] AI message saved: %s", ai_message.id)
 
         # Send response back to the appropriate channel
         if channel == "twilio" and original_from:
             _send_twilio_reply(original_from, ai_response, is_whatsapp=is_whatsapp)
 
     except Exception as e:
-        twilio_logger.error(f"[BackgroundTask] Error processing AI response: {e}")
+        twilio_logger.error("[BackgroundTask] Error processing AI response: %s", e)
 
 
-def _format_whatsapp_number(from_number: str) -> str:
-    """Format a WhatsApp number from URL-encoded format.
-
-    Twilio sends numbers as: whatsapp%3A%2B60127939038
-    Twilio API expects: whatsapp:+60127939038
-    """
-    from urllib.parse import unquote
+# Reply timeout so a hanging Twilio API cannot pin background-task threads
+TWILIO_TIMEOUT_SECONDS = 5
 
-    # URL decode the number
-    decoded = unquote(from_number)
 
-    # If it's a WhatsApp number, ensure proper format
-    if decoded.lower().startswith("whatsapp:"):
-        # Remove any existing prefix issues and ensure clean format
-        # e.g., "whatsapp:+60127939038"
-        return decoded
+@lru_cache(maxsize=1)
+def _get_twilio_client(account_sid: str, auth_token: str):
+    """Build the Twilio client once per credentials so its HTTP session is reused."""
+    from twilio.rest import Client
+    from twilio.http.http_client import TwilioHttpClient
 
-    return decoded
+    return Client(account_sid, auth_token, http_client=TwilioHttpClient(timeout=TWILIO_TIMEOUT_SECONDS))
 
 
 def _send_twilio_reply(to_number: str, message: str, is_whatsapp: bool = False):
     """Send reply via Twilio API (SMS or WhatsApp)."""
     try:
-        from twilio.rest import Client
-        from dotenv import load_dotenv
-        import os
-
-        load_dotenv()
-
+        # Environment was loaded from .env at startup
         account_sid = os.getenv("TWILIO_ACCOUNT_SID")
         auth_token = os.getenv("TWILIO_AUTH_TOKEN")
         twilio_number = os.getenv("TWILIO_PHONE_NUMBER")
@@ -165,8 +184,8 @@ def _send_twilio_reply(to_number: str, message: str, is_whatsapp: bool = False):
             twilio_logger.warning("[Twilio] Missing Twilio credentials")
             return
 
-        # Format the recipient number
-        recipient = _format_whatsapp_number(to_number)
+        # Numbers arrive already URL-decoded, e.g. "whatsapp:+60127939038"
+        recipient = to_number
 
         # Get sender number and format for WhatsApp if needed
         sender = twilio_number
@@ -179,33 +198,34 @@ def _send_twilio_reply(to_number: str, message: str, is_whatsapp: bool = False):
             recipient = recipient.replace("whatsapp:", "") if recipient.lower().startswith("whatsapp:") else recipient
             sender = sender.replace("whatsapp:", "") if sender.lower().startswith("whatsapp:") else sender
 
-        twilio_logger.info(f"[Twilio] Sending message: from={sender}, to={recipient}")
+        twilio_logger.info("[Twilio] Sending message: from=%s, to=%s", sender, recipient)
 
-        client = Client(account_sid, auth_token)
+        client = _get_twilio_client(account_sid, auth_token)
         twilio_message = client.messages.create(
             body=message,
             from_=sender,
             to=recipient
         )
-        twilio_logger.info(f"[Twilio] Reply sent: {twilio_message.sid}")
+        twilio_logger.info("[Twilio] Reply sent: %s", twilio_message.sid)
 
     except Exception as e:
-        twilio_logger.error(f"[Twilio] Failed to send reply: {e}")
+        twilio_logger.error("[Twilio] Failed to send reply: %s", e)
 
 
 # =============================================================================
 # AI MESSAGE PROCESSING PATTERN
 # =============================================================================
 # When a message is saved (via any channel), the AI should automatically respond.
-# This is implemented using a background task to avoid blocking the webhook.
+# This is implemented with the orchestrator's shared worker pool
+# (submit_ai_task) so the webhook never waits on the LLM or Twilio.
 #
 # Pattern for new channels (WhatsApp, Web, API, etc.):
 #   1. Save the incoming message to the database
-#   2. Trigger AI processing via BackgroundTasks
+#   2. Trigger AI processing via submit_ai_task
 #   3. Return success to the channel immediately
 #
 # The AI processing flow:
-#   - Message is saved → process_ai_response_task (BackgroundTasks)
+#   - Message is saved → process_ai_response_task (submit_ai_task)
 #   - Orchestrator checks message content for agent routing
 #   - If report-related → report_agent handles it
 #   - Otherwise → general conversational AI
@@ -213,21 +233,21 @@ def _send_twilio_reply(to_number: str, message: str, is_whatsapp: bool = False):
 # =============================================================================
 
 @app.post("/twilio_webhook")
-async def twilio_webhook(request: Request, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+async def twilio_webhook(request: Request, db: Session = Depends(get_db)):
     """
     Twilio webhook endpoint for incoming messages.
     Logs raw request, saves to database, and triggers AI processing in background.
     """
-    # Get raw request body for logging
+    # Get raw request body for logging (buffered, so request.form() reuses it)
     try:
         raw_body = await request.body()
-        raw_text = raw_body.decode('utf-8') if raw_body else ""
     except Exception as e:
-        raw_text = f"Error reading body: {str(e)}"
+        twilio_logger.error("Error reading body: %s", e)
         raw_body = b""
 
-    # Log the raw request
-    twilio_logger.info(f"Raw Twilio request: {raw_text}")
+    # The full payload is only logged for debugging; the parsed fields are
+    # logged at INFO below. The bytes are logged as-is (repr), never decoded.
+    twilio_logger.debug("Raw Twilio request: %r", raw_body)
 
     # Parse form data from the request
     form_data = {}
@@ -235,12 +255,13 @@ async def twilio_webhook(request: Request, background_tasks: BackgroundTasks, db
         # Try to parse as form data (application/x-www-form-urlencoded)
         content_type = request.headers.get("content-type", "")
         if "application/x-www-form-urlencoded" in content_type:
-            form_data = {k: v for k, v in (pair.split("=") for pair in raw_text.split("&") if "=" in pair)}
+            # Starlette decodes the (already buffered) body, including %XX escapes
+            form_data = dict(await request.form())
         elif "application/json" in content_type:
-            form_data = json.loads(raw_text) if raw_text else {}
+            form_data = orjson.loads(raw_body) if raw_body else {}
     except Exception as e:
-        twilio_logger.error(f"Error parsing request body: {str(e)}")
-        form_data = {"raw": raw_text}
+        twilio_logger.error("Error parsing request body: %s", e)
+        form_data = {"raw": raw_body.decode('utf-8', 'replace')}
 
     # Get phone number from Twilio request
     from_number = form_data.get("From", form_data.get("from", ""))
@@ -248,62 +269,77 @@ async def twilio_webhook(request: Request, background_tasks: BackgroundTasks, db
     message_body = form_data.get("Body", form_data.get("body", ""))
     message_sid = form_data.get("MessageSid", form_data.get("message_sid", ""))
 
-    twilio_logger.info(f"From: {from_number}, To: {to_number}, Body: {message_body[:100]}...")
-
-    # Look up user by phone number
-    user = None
-    if from_number:
-        # Normalize phone number (remove non-digits for comparison)
-        normalized_from = "".join(filter(str.isdigit, from_number))
-        user = db.query(User).filter(
-            User.phone_number.isnot(None)
-        ).all()
-        
-        for u in user:
-            if u.phone_number:
-                normalized_user_phone = "".join(filter(str.isdigit, u.phone_number))
-                if normalized_user_phone in normalized_from or normalized_from in normalized_user_phone:
-                    user = u
-                    break
-        else:
-            user = None
+    twilio_logger.info("From: %s, To: %s, Body: %.100s...", from_number, to_number, message_body)
 
-    if user:
-        twilio_logger.info(f"Found user {user.username} for phone number {from_number}")
+    # Database work blocks, so it runs in the threadpool rather than on the loop
+    saved = await run_in_threadpool(_save_twilio_message, db, from_number, message_body, message_sid)
 
-        # Create message record
-        message = Message(
-            sender_id=user.id,
-            recipient_id=user.id,  # Self-message for now
-            content=message_body,
-            conversation_id=message_sid or from_number
-        )
-        db.add(message)
-        db.commit()
-        db.refresh(message)
-
-        twilio_logger.info(f"Saved message {message.id} for user {user.username}")
+    if saved:
+        user_id, message_id = saved
 
         # Determine if this is WhatsApp (check for "whatsapp:" in From field)
         is_whatsapp = "whatsapp:" in from_number.lower() or "whatsapp%3a" in from_number.lower()
 
-        # Trigger AI processing in background (non-blocking)
-        background_tasks.add_task(
+        # Trigger AI processing on the shared worker pool (non-blocking)
+        submit_ai_task(
             process_ai_response_task,
-            user_id=user.id,
+            user_id=user_id,
             message_content=message_body,
             conversation_id=message_sid or from_number,
             channel="twilio",
             original_from=from_number,
             is_whatsapp=is_whatsapp
         )
-        twilio_logger.info(f"[BackgroundTask] Queued AI processing for message {message.id}")
+        twilio_logger.info("[BackgroundTask] Queued AI processing for message %s", message_id)
 
-        return {"status": "message saved", "user_id": user.id, "message_id": message.id}
+        return {"status": "message saved", "user_id": user_id, "message_id": message_id}
     else:
-        twilio_logger.warning(f"No user found for phone number {from_number}")
+        twilio_logger.warning("No user found for phone number %s", from_number)
         return {"status": "user not found", "from": from_number}
 
+
+def _save_twilio_message(db: Session, from_number: str, message_body: str, message_sid: str):
+    """Find the sender by phone number and store the incoming message.
+
+    Returns (user_id, message_id), or None when no user matches.
+    """
+    # Look up user by phone number
+    user = None
+    if from_number:
+        # Normalize phone number (remove non-digits for comparison) and match
+        # the indexed digits-only column; fall back to the indexed trailing
+        # digits so a missing or extra country code still resolves
+        normalized_from = normalize_phone(from_number)
+        if normalized_from:
+            user = db.query(User).filter(User.phone_normalized == normalized_from).first()
+            suffix = phone_suffix(normalized_from)
+            if user is None and suffix is not None:
+                matches = db.query(User).filter(User.phone_suffix == suffix).limit(2).all()
+                if len(matches) == 1:
+                    user = matches[0]
+                elif matches:
+                    # Never guess between accounts that share the trailing digits
+                    twilio_logger.warning("Phone number %s matches several users", from_number)
+
+    if not user:
+        return None
+
+    twilio_logger.info("Found user %s for phone number %s", user.username, from_number)
+
+    # Create message record
+    message = Message(
+        sender_id=user.id,
+        recipient_id=user.id,  # Self-message for now
+        content=message_body,
+        conversation_id=message_sid or from_number
+    )
+    db.add(message)
+    db.commit()
+
+    twilio_logger.info("Saved message %s for user %s", message.id, user.username)
+
+    return user.id, message.id
+
 if __name__ == "__main__":
     host = os.getenv("AI_MESSAGE_HOST", "0.0.0.0")
     port = int(os.getenv("AI_MESSAGE_PORT", 8000))
@@ -311,12 +347,19 @@ if __name__ == "__main__":
     cert_file = os.getenv("AI_MESSAGE_SSL_CERT", "ssl/cert.pem")
     key_file = os.getenv("AI_MESSAGE_SSL_KEY", "ssl/key.pem")
     
+    # Each worker is a separate process with its own caches and AI task pool
+    workers = int(os.getenv("AI_MESSAGE_WORKERS", "1"))
+    
     print(f"Starting server for domain: {domain}")
     
+    # uvloop and httptools ship with uvicorn[standard]; uvloop has no Windows build
     uvicorn.run(
         "backend.main:app",
         host=host,
         port=port,
         ssl_certfile=cert_file,
-        ssl_keyfile=key_file
+        ssl_keyfile=key_file,
+        loop="auto" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=workers
     )
\ No newline at end of file
@@ -1,31 +1,37 @@
+from functools import lru_cache
 from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import Response
+from pydantic import TypeAdapter
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import func, select, or_, lambda_stmt
 
-from db.config import get_db
+from db.config import get_db, SessionLocal
 from db.models import User, Message
 from auth.schemas import MessageResponse, MessageCreate, MessageUpdate
-from auth.utils import get_current_user
+from auth.utils import TokenUser, get_current_principal
 from init_logs import messages_logger
 
 # Import orchestrator for AI message handling
 import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from orchestrator import get_orchestrator, setup_orchestrator
+from orchestrator import get_orchestrator, setup_orchestrator, submit_ai_task
 
 # AI bot user ID (negative ID to distinguish from real users)
 AI_BOT_USER_ID = -1
 
 router = APIRouter(prefix="/messages", tags=["Messages"])
 
+# Handlers are plain `def`: the SQLAlchemy Session and the orchestrator's LLM
+# calls block, so FastAPI runs them in its threadpool, off the event loop.
+
 
 # =============================================================================
 # AI MESSAGE PROCESSING TRIGGER
 # =============================================================================
 # When a message is sent to the AI bot (recipient_id = AI_BOT_USER_ID),
-# AI processing is automatically triggered via BackgroundTasks.
+# AI processing is automatically triggered on the orchestrator's worker pool.
 #
 # This pattern ensures:
 #   1. Message is saved to database
@@ -33,8 +39,8 @@ router = APIRouter(prefix="/messages", tags=["Messages"])
 #   3. Response is saved as a new message from AI bot
 #
 # Channels using this pattern:
-#   - Twilio: /twilio_webhook → saves message → BackgroundTasks
-#   - Web/API: POST /messages → if recipient is AI_BOT_USER_ID → BackgroundTasks
+#   - Twilio: /twilio_webhook → saves message → submit_ai_task
+#   - Web/API: POST /messages → if recipient is AI_BOT_USER_ID → submit_ai_task
 # =============================================================================
 
 def process_ai_message_task(user_id: int, message_content: str, conversation_id: str):
@@ -46,8 +52,7 @@ def process_ai_message_task(user_id: int, message_content: str, conversation_id:
         ai_response = orchestrator.process_message(user_id, message_content)
 
         # Save AI response
-        db: Session = next(get_db())
-        try:
+        with SessionLocal() as db:
             ai_message = Message(
                 sender_id=AI_BOT_USER_ID,
                 recipient_id=user_id,
@@ -57,84 +62,127 @@ def process_ai_message_task(user_id: int, message_content: str, conversation_id:
             )
             db.add(ai_message)
             db.commit()
-            messages_logger.info(f"[BackgroundTask] AI message {ai_message.id} saved")
-        finally:
-            db.close()
+            messages_logger.info("[BackgroundTask] AI message %s saved", ai_message.id)
 
     except Exception as e:
-        messages_logger.error(f"[BackgroundTask] AI processing error: {e}")
+        messages_logger.error("[BackgroundTask] AI processing error: %s", e)
+
+
+@lru_cache(maxsize=4096)
+def _conversation_id(user_a: int, user_b: int) -> str:
+    """Canonical conversation id for a pair of users, independent of direction"""
+    low, high = (user_a, user_b) if user_a < user_b else (user_b, user_a)
+    return f"conv_{low}_{high}"
 
 
 # ==================== MESSAGES CRUD ====================
 
+# List endpoints serialize their page in one pass through this adapter and
+# return the bytes directly; response_model stays on the routes for the docs
+_MESSAGE_LIST = TypeAdapter(list[MessageResponse])
+
+
+def _message_list_response(messages) -> Response:
+    """JSON response for a page of messages"""
+    page = _MESSAGE_LIST.validate_python(messages, from_attributes=True)
+    return Response(_MESSAGE_LIST.dump_json(page), media_type="application/json")
+
+
+def _chronological(page):
+    """Wrap a newest-first page of messages so SQL returns it oldest-first"""
+    recent = aliased(Message, page.subquery())
+    return select(recent).order_by(recent.created_at, recent.id)
+
+
 @router.get("", response_model=list[MessageResponse])
-async def list_messages(
+def list_messages(
     skip: int = 0,
     limit: int = 100,
     unread_only: bool = False,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """List all messages for the current user (sent or received)"""
-    query = db.query(Message).filter(
-        (Message.sender_id == current_user.id) | (Message.recipient_id == current_user.id)
-    )
+    # lambda_stmt caches the compiled SQL; user_id, skip and limit are bound
+    user_id = current_user.id
+    stmt = lambda_stmt(lambda: select(Message).where(
+        or_(Message.sender_id == user_id, Message.recipient_id == user_id)
+    ))
     
     if unread_only:
-        query = query.filter(
-            Message.recipient_id == current_user.id,
+        stmt += lambda s: s.where(
+            Message.recipient_id == user_id,
             Message.is_read == False
         )
     
-    messages = query.order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return messages[::-1]  # Reverse to get chronological order
+    stmt += lambda s: s.order_by(Message.created_at.desc(), Message.id.desc()).offset(skip).limit(limit)
+    stmt += lambda s: _chronological(s)
+    return _message_list_response(db.execute(stmt).scalars().all())
 
 
 @router.get("/sent", response_model=list[MessageResponse])
-async def list_sent_messages(
+def list_sent_messages(
     skip: int = 0,
     limit: int = 100,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """List all messages sent by the current user"""
-    messages = db.query(Message).filter(
-        Message.sender_id == current_user.id
-    ).order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return messages[::-1]
+    user_id = current_user.id
+    stmt = lambda_stmt(
+        lambda: select(Message).where(Message.sender_id == user_id)
+        .order_by(Message.created_at.desc(), Message.id.desc()).offset(skip).limit(limit)
+    )
+    stmt += lambda s: _chronological(s)
+    return _message_list_response(db.execute(stmt).scalars().all())
 
 
 @router.get("/received", response_model=list[MessageResponse])
-async def list_received_messages(
+def list_received_messages(
     skip: int = 0,
     limit: int = 100,
     unread_only: bool = False,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """List all messages received by the current user"""
-    query = db.query(Message).filter(
-        Message.recipient_id == current_user.id
-    )
+    user_id = current_user.id
+    stmt = lambda_stmt(lambda: select(Message).where(Message.recipient_id == user_id))
     
     if unread_only:
-        query = query.filter(Message.is_read == False)
+        stmt += lambda s: s.where(Message.is_read == False)
     
-    messages = query.order_by(Message.created_at.desc()).offset(skip).limit(limit).all()
-    
-    return messages[::-1]
+    stmt += lambda s: s.order_by(Message.created_at.desc(), Message.id.desc()).offset(skip).limit(limit)
+    stmt += lambda s: _chronological(s)
+    return _message_list_response(db.execute(stmt).scalars().all())
+
+
+# Registered before the /{message_id} routes, which would otherwise match
+# "read-all" as a message id and reject it with a 422
+@router.put("/read-all", response_model=dict)
+def mark_all_read(
+    current_user: TokenUser = Depends(get_current_principal),
+    db: Session = Depends(get_db)
+):
+    """Mark all received messages as read"""
+    updated = db.query(Message).filter(
+        Message.recipient_id == current_user.id,
+        Message.is_read == False
+    ).update({"is_read": True}, synchronize_session=False)
+
+    db.commit()
+
+    return {"message": "All messages marked as read", "updated_count": updated}
 
 
 @router.get("/{message_id}", response_model=MessageResponse)
-async def get_message(
+def get_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get a specific message by ID"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = db.get(Message, message_id)
     
     if not message:
         raise HTTPException(
@@ -153,10 +201,9 @@ async def get_message(
 
 
 @router.post("", response_model=MessageResponse, status_code=status.HTTP_201_CREATED)
-async def create_message(
+def create_message(
     message_data: MessageCreate,
-    background_tasks: BackgroundTasks,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Send a new message.
@@ -169,7 +216,7 @@ async def create_message(
     # For AI bot, skip recipient verification
     if not is_ai_message:
         # Verify recipient exists
-        recipient = db.query(User).filter(User.id == message_data.recipient_id).first()
+        recipient = db.get(User, message_data.recipient_id)
         if not recipient:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -180,8 +227,7 @@ async def create_message(
     conversation_id = message_data.conversation_id
     if not conversation_id:
         # Create a consistent conversation ID based on both user IDs
-        user_ids = sorted([current_user.id, message_data.recipient_id])
-        conversation_id = f"conv_{user_ids[0]}_{user_ids[1]}"
+        conversation_id = _conversation_id(current_user.id, message_data.recipient_id)
 
     message = Message(
         sender_id=current_user.id,
@@ -190,34 +236,35 @@ async def create_message(
         conversation_id=conversation_id
     )
 
+    # id and timestamps come back from the INSERT's RETURNING (eager_defaults),
+    # so no refresh SELECT is needed before serializing
     db.add(message)
     db.commit()
-    db.refresh(message)
 
-    messages_logger.info(f"Message {message.id} sent from user {current_user.id} to user {message_data.recipient_id}")
+    messages_logger.info("Message %s sent from user %s to user %s", message.id, current_user.id, message_data.recipient_id)
 
     # Trigger AI processing if sending to AI bot (non-blocking)
     if is_ai_message:
-        background_tasks.add_task(
+        submit_ai_task(
             process_ai_message_task,
             user_id=current_user.id,
             message_content=message_data.content,
             conversation_id=conversation_id
         )
-        messages_logger.info(f"[BackgroundTask] Queued AI processing for message {message.id}")
+        messages_logger.info("[BackgroundTask] Queued AI processing for message %s", message.id)
 
     return message
 
 
 @router.put("/{message_id}", response_model=MessageResponse)
-async def update_message(
+def update_message(
     message_id: int,
     message_data: MessageUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Update a message (only sender can update, only content can be changed)"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = db.get(Message, message_id)
     
     if not message:
         raise HTTPException(
@@ -237,47 +284,48 @@ async def update_message(
         message.content = message_data.content
     
     db.commit()
-    db.refresh(message)
     
     return message
 
 
 @router.put("/{message_id}/read")
-async def mark_message_read(
+def mark_message_read(
     message_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Mark a message as read"""
-    message = db.query(Message).filter(Message.id == message_id).first()
-    
-    if not message:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Message not found"
-        )
+    # Only recipient can mark as read; the check is part of the UPDATE itself
+    updated = db.query(Message).filter(
+        Message.id == message_id,
+        Message.recipient_id == current_user.id
+    ).update({"is_read": True}, synchronize_session=False)
     
-    # Only recipient can mark as read
-    if message.recipient_id != current_user.id:
+    if not updated:
+        # Nothing matched: tell a missing message apart from someone else's
+        if db.query(Message.id).filter(Message.id == message_id).first() is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Message not found"
+            )
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Only the recipient can mark this message as read"
         )
     
-    message.is_read = True
     db.commit()
     
     return {"message": "Message marked as read"}
 
 
 @router.delete("/{message_id}")
-async def delete_message(
+def delete_message(
     message_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Delete a message"""
-    message = db.query(Message).filter(Message.id == message_id).first()
+    message = db.get(Message, message_id)
     
     if not message:
         raise HTTPException(
@@ -295,46 +343,33 @@ async def delete_message(
     db.delete(message)
     db.commit()
     
-    messages_logger.info(f"Message {message_id} deleted by user {current_user.id}")
+    messages_logger.info("Message %s deleted by user %s", message_id, current_user.id)
     
     return {"message": "Message deleted successfully"}
 
 
 @router.get("/unread/count")
-async def get_unread_count(
-    current_user: User = Depends(get_current_user),
+def get_unread_count(
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get count of unread messages"""
-    count = db.query(func.count(Message.id)).filter(
-        Message.recipient_id == current_user.id,
-        Message.is_read == False
-    ).scalar()
+    user_id = current_user.id
+    count = db.execute(lambda_stmt(
+        lambda: select(func.count(Message.id)).where(
+            Message.recipient_id == user_id,
+            Message.is_read == False
+        )
+    )).scalar()
     
     return {"unread_count": count or 0}
 
 
-@router.put("/read-all", response_model=dict)
-async def mark_all_read(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
-):
-    """Mark all received messages as read"""
-    db.query(Message).filter(
-        Message.recipient_id == current_user.id,
-        Message.is_read == False
-    ).update({"is_read": True})
-
-    db.commit()
-
-    return {"message": "All messages marked as read"}
-
-
 # =============================================================================
 # AI MESSAGE HANDLING
 # =============================================================================
 # AI messages are automatically triggered when sending to AI_BOT_USER_ID (-1)
-# via the create_message endpoint using BackgroundTasks.
+# via the create_message endpoint on the orchestrator's worker pool.
 #
 # Available endpoints for AI interaction:
 #   1. POST /messages with recipient_id=-1 → Auto-triggers AI (non-blocking)
@@ -342,9 +377,9 @@ async def mark_all_read(
 # =============================================================================
 
 @router.post("/ai", response_model=MessageResponse)
-async def send_ai_message(
+def send_ai_message(
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Send a message to the AI assistant and get a response synchronously.
@@ -359,8 +394,7 @@ async def send_ai_message(
     # Generate conversation_id if not provided
     conversation_id = message_data.conversation_id
     if not conversation_id:
-        user_ids = sorted([current_user.id, AI_BOT_USER_ID])
-        conversation_id = f"conv_{user_ids[0]}_{user_ids[1]}"
+        conversation_id = _conversation_id(current_user.id, AI_BOT_USER_ID)
 
     # Save user message
     user_message = Message(
@@ -371,14 +405,13 @@ async def send_ai_message(
     )
     db.add(user_message)
     db.commit()
-    db.refresh(user_message)
 
     # Get AI response (synchronous)
     try:
         orchestrator = get_orchestrator()
         ai_response = orchestrator.process_message(current_user.id, message_data.content)
     except Exception as e:
-        messages_logger.error(f"AI processing error: {e}")
+        messages_logger.error("AI processing error: %s", e)
         ai_response = "I apologize, but I encountered an error while processing your message. Please try again later."
 
     # Save AI response message
@@ -391,29 +424,28 @@ async def send_ai_message(
     )
     db.add(ai_message)
     db.commit()
-    db.refresh(ai_message)
 
-    messages_logger.info(f"AI message {ai_message.id} sent to user {current_user.id}")
+    messages_logger.info("AI message %s sent to user %s", ai_message.id, current_user.id)
 
     return ai_message
 
 
 @router.post("/ai/twilio", response_model=MessageResponse)
-async def twilio_ai_message(
+def twilio_ai_message(
     message_data: MessageCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Send a message to the AI assistant via Twilio integration.
 
     This is an alias for POST /messages/ai, provided for Twilio integration.
     """
-    return await send_ai_message(message_data, current_user, db)
+    return send_ai_message(message_data, current_user, db)
 
 
 @router.delete("/history/clear")
-async def clear_chat_history(
-    current_user: User = Depends(get_current_user)
+def clear_chat_history(
+    current_user: TokenUser = Depends(get_current_principal)
 ):
     """Clear the chat history for the current user."""
     orchestrator = get_orchestrator()
@@ -422,8 +454,8 @@ async def clear_chat_history(
 
 
 @router.get("/history")
-async def get_chat_history(
-    current_user: User = Depends(get_current_user)
+def get_chat_history(
+    current_user: TokenUser = Depends(get_current_principal)
 ):
     """Get the current chat history for the user."""
     orchestrator = get_orchestrator()
@@ -8,94 +8,193 @@ Configure via environment variables:
 - LITELLM_BASEURL: The base URL for LiteLLM API
 - LITELLM_API_KEY: The API key for authentication
 - LITELLM_MODEL: The model to use (e.g., gpt-4, gpt-3.5-turbo-1106)
+- LITELLM_SIMPLE_MODEL: Cheaper model for greetings and thanks (default: LITELLM_MODEL)
 - CHAT_HISTORY_MAX: Maximum number of chat history entries (default: 50)
+- CHAT_HISTORY_USERS_MAX: Users whose history is kept in memory (default: 10000)
+- CHAT_HISTORY_TTL_SECONDS: Idle time before a user's history is dropped (default: 3600)
+- AI_TASK_WORKERS: Concurrent background AI replies (default: 8)
+- LITELLM_MAX_CONNECTIONS: Pooled HTTP connections to LiteLLM (default: 128)
+- LITELLM_TIMEOUT_SECONDS: LiteLLM request timeout (default: 30)
 
 Logging: Uses orchestrator_logger from init_logs
         Logs are written to logs/orchestrator.log
 """
 
+import asyncio
+import atexit
+import hashlib
 import os
+import re
 import sys
-import json
-from typing import Dict, List, Any, Optional, Callable, Tuple
-from datetime import datetime
+import threading
+from collections import deque
+from itertools import islice
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Any, Optional, Callable, Sequence, Tuple
 
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from dotenv import load_dotenv
-from litellm import completion
+import httpx
+import litellm
+import orjson
+from cachetools import TTLCache
+from litellm import acompletion, completion
+
+from db.config import load_env
 
 # Import orchestrator logger from init_logs
 # NOTE: If adding new loggers, define them in init_logs.py following the pattern:
 #   orchestrator_logger = setup_logger("orchestrator", "orchestrator.log")
 from init_logs import orchestrator_logger
 
-load_dotenv()
+# Load .env before reading the configuration below
+load_env()
 
 # Configuration
 BASE_URL = os.environ.get("LITELLM_BASEURL", "")
 API_KEY = os.environ.get("LITELLM_API_KEY", "")
 MODEL = os.environ.get("LITELLM_MODEL", "gpt-3.5-turbo-1106")
+SIMPLE_MODEL = os.environ.get("LITELLM_SIMPLE_MODEL", MODEL)
 CHAT_HISTORY_MAX = int(os.environ.get("CHAT_HISTORY_MAX", "50"))
+CHAT_HISTORY_USERS_MAX = int(os.environ.get("CHAT_HISTORY_USERS_MAX", "10000"))
+CHAT_HISTORY_TTL_SECONDS = int(os.environ.get("CHAT_HISTORY_TTL_SECONDS", "3600"))
+AI_TASK_WORKERS = int(os.environ.get("AI_TASK_WORKERS", "8"))
+LITELLM_MAX_CONNECTIONS = int(os.environ.get("LITELLM_MAX_CONNECTIONS", "128"))
+LITELLM_TIMEOUT_SECONDS = float(os.environ.get("LITELLM_TIMEOUT_SECONDS", "30"))
+
+# One pooled HTTP client per process for every LiteLLM call (orchestrator and
+# agents alike), so keep-alive connections are reused instead of paying a new
+# TCP/TLS handshake per message
+_HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=LITELLM_MAX_CONNECTIONS // 2,
+    max_connections=LITELLM_MAX_CONNECTIONS,
+)
+_HTTP_CLIENT = httpx.Client(http2=True, limits=_HTTP_LIMITS, timeout=LITELLM_TIMEOUT_SECONDS)
+_ASYNC_HTTP_CLIENT = httpx.AsyncClient(http2=True, limits=_HTTP_LIMITS, timeout=LITELLM_TIMEOUT_SECONDS)
+litellm.client_session = _HTTP_CLIENT
+litellm.aclient_session = _ASYNC_HTTP_CLIENT
+
+
+def _close_http_clients() -> None:
+    """Close the pooled LiteLLM HTTP clients at interpreter exit."""
+    _HTTP_CLIENT.close()
+    try:
+        asyncio.run(_ASYNC_HTTP_CLIENT.aclose())
+    except RuntimeError:
+        # An event loop is still running; its connections die with the process
+        pass
+
+
+atexit.register(_close_http_clients)
+
+# Simple-message fast path: short greetings/thanks get SIMPLE_MODEL, a shorter
+# system prompt and only the most recent history
+SIMPLE_MESSAGE_MAX_CHARS = 40
+SIMPLE_HISTORY_MESSAGES = 4
+_SIMPLE_PHRASE = (
+    r"(?:(?:hi|hello|hey)(?: there)?|yo|thanks|thank you|thx|ok|okay|cool|great|bye|goodbye|"
+    r"good (?:morning|afternoon|evening|night))"
+)
+# The whole message must be simple phrases separated only by punctuation,
+# whitespace or emoji, so "ok so my name is Bob" keeps the full model
+_SIMPLE_MESSAGE = re.compile(rf"\W*{_SIMPLE_PHRASE}(?:\W+{_SIMPLE_PHRASE})*\W*", re.IGNORECASE)
+
+
+def _is_simple(message: str) -> bool:
+    """True for short greetings or acknowledgements that need no real reasoning."""
+    return (
+        len(message) < SIMPLE_MESSAGE_MAX_CHARS
+        and "?" not in message
+        and _SIMPLE_MESSAGE.fullmatch(message) is not None
+    )
+
+
+# System messages for general conversation; built once and shared by every request
+_CASUAL_SYSTEM_MESSAGE = {"role": "system", "content": """You are a helpful AI assistant for a messaging application.
+Respond to the user's message in a friendly, helpful way.
+Keep your response concise and conversational.
+You can help with various tasks including managing reports and general questions.
+Plain text only, no special characters or emojis."""}
+_SIMPLE_SYSTEM_MESSAGE = {"role": "system", "content": """You are a helpful AI assistant for a messaging application.
+Reply briefly and warmly. Plain text only, no special characters or emojis."""}
+
+
+# Replies to simple messages, keyed by a digest of the model and the exact
+# messages sent; two users saying "hi" with the same recent context share one
+# LLM call. Personalised (non-simple) conversations are never cached.
+REPLY_CACHE_MAXSIZE = 2048
+REPLY_CACHE_TTL_SECONDS = 300
+_reply_cache = TTLCache(maxsize=REPLY_CACHE_MAXSIZE, ttl=REPLY_CACHE_TTL_SECONDS)
+_reply_cache_lock = threading.Lock()
+
+
+def _reply_cache_key(model: str, messages: List[Dict[str, str]]) -> bytes:
+    """Digest of the model and request messages used as the reply cache key."""
+    return hashlib.blake2b(orjson.dumps([model, messages]), digest_size=16).digest()
+
+
+def _cached_reply(key: Optional[bytes]) -> Optional[str]:
+    """Return the cached reply for key, or None on a miss or when key is None."""
+    if key is None:
+        return None
+    with _reply_cache_lock:
+        return _reply_cache.get(key)
+
+
+def _store_reply(key: Optional[bytes], content: str) -> None:
+    """Cache content under key; a None key (uncacheable message) is ignored."""
+    if key is None:
+        return
+    with _reply_cache_lock:
+        _reply_cache[key] = content
 
 
 class ChatHistory:
     """Manages chat history with max limit, keeping only user and assistant messages."""
 
+    # One instance per user: slots keep the per-instance footprint small
+    __slots__ = ("max_entries", "history")
+
     def __init__(self, max_entries: int = 50):
         self.max_entries = max_entries
-        self.history: List[Dict[str, str]] = []
+        # Bounded deque: appending past max_entries drops the oldest entry
+        self.history: deque = deque(maxlen=max_entries)
 
     def add_user_message(self, content: str) -> None:
         """Add a user message to history."""
         self.history.append({
             "role": "user",
-            "content": content,
-            "timestamp": datetime.utcnow().isoformat()
+            "content": content
         })
-        self._trim_history()
 
     def add_assistant_message(self, content: str) -> None:
         """Add an assistant message to history."""
         self.history.append({
             "role": "assistant",
-            "content": content,
-            "timestamp": datetime.utcnow().isoformat()
+            "content": content
         })
-        self._trim_history()
 
     def add_message(self, role: str, content: str) -> None:
         """Add a message with specified role."""
         if role in ["user", "assistant"]:
             self.history.append({
                 "role": role,
-                "content": content,
-                "timestamp": datetime.utcnow().isoformat()
+                "content": content
             })
-            self._trim_history()
-
-    def _trim_history(self) -> None:
-        """Trim history to max entries, keeping most recent."""
-        # Filter to only user and assistant messages
-        filtered = [m for m in self.history if m["role"] in ["user", "assistant"]]
-
-        # Trim to max entries
-        if len(filtered) > self.max_entries:
-            self.history = filtered[-self.max_entries:]
-        else:
-            self.history = filtered
 
     def get_history(self) -> List[Dict[str, str]]:
-        """Get history as list of message dicts (without timestamp for API calls)."""
-        return [
-            {"role": m["role"], "content": m["content"]}
-            for m in self.history
-        ]
+        """Get history as a list of message dicts; the list is a copy, the dicts are shared."""
+        # Entries are already in API shape and never mutated, so a shallow copy suffices
+        return list(self.history)
+
+    def get_history_view(self) -> deque:
+        """Get the live history without copying; callers must not modify it."""
+        return self.history
 
     def clear(self) -> None:
         """Clear all history."""
-        self.history = []
+        self.history.clear()
 
     def __len__(self) -> int:
         return len(self.history)
@@ -107,14 +206,20 @@ class ChatHistory:
 class Agent:
     """Represents a registered agent with its capabilities."""
 
+    __slots__ = (
+        "name", "description", "system_prompt", "tools",
+        "available_functions", "chat_func", "keywords",
+    )
+
     def __init__(
         self,
         name: str,
         description: str,
         system_prompt: str,
-        tools: List[Dict],
+        tools: Sequence[Dict],
         available_functions: Dict[str, Callable],
-        chat_func: Callable[[str, list, int], Tuple[str, list]]
+        chat_func: Callable[[str, list, int], Tuple[str, list]],
+        keywords: Tuple[str, ...] = ()
     ):
         self.name = name
         self.description = description
@@ -122,162 +227,269 @@ class Agent:
         self.tools = tools
         self.available_functions = available_functions
         self.chat_func = chat_func
+        self.keywords = keywords
 
 
 class MessageOrchestrator:
     """Orchestrates message handling and AI agent coordination."""
 
+    __slots__ = (
+        "agents", "conversation_histories", "max_history",
+        "_histories_lock", "_keyword_pattern", "_keyword_agents",
+        "_agents_summary", "_capabilities",
+    )
+
     def __init__(self, max_history: int = None):
         self.agents: Dict[str, Agent] = {}
-        self.conversation_histories: Dict[int, ChatHistory] = {}  # user_id -> ChatHistory
+        # user_id -> ChatHistory; idle users expire so one-off senders don't pile up
+        self.conversation_histories: TTLCache = TTLCache(
+            maxsize=CHAT_HISTORY_USERS_MAX, ttl=CHAT_HISTORY_TTL_SECONDS
+        )
+        self._histories_lock = threading.Lock()
         self.max_history = max_history or CHAT_HISTORY_MAX
+        # One alternation over every agent's keywords, rebuilt on registration
+        self._keyword_pattern: Optional[re.Pattern] = None
+        self._keyword_agents: Dict[str, str] = {}  # regex group name -> agent name
+        # Built lazily and reset on registration; agents rarely change after startup
+        self._agents_summary: Optional[str] = None
+        self._capabilities: Optional[Dict[str, Any]] = None
 
     def get_history(self, user_id: int) -> ChatHistory:
         """Get or create chat history for a user."""
-        if user_id not in self.conversation_histories:
-            self.conversation_histories[user_id] = ChatHistory(max_entries=self.max_history)
-        return self.conversation_histories[user_id]
+        with self._histories_lock:
+            chat_history = self.conversation_histories.get(user_id)
+            if chat_history is None:
+                chat_history = ChatHistory(max_entries=self.max_history)
+            # Re-inserting restarts the TTL, so only idle histories expire
+            self.conversation_histories[user_id] = chat_history
+        return chat_history
 
     def register_agent(self, agent: Agent) -> None:
         """Register a new agent."""
         self.agents[agent.name] = agent
-        orchestrator_logger.info(f"Registered agent: {agent.name}")
+        self._build_keyword_pattern()
+        self._agents_summary = None
+        self._capabilities = None
+        orchestrator_logger.info("Registered agent: %s", agent.name)
+
+    def _build_keyword_pattern(self) -> None:
+        """Compile all agents' keywords into a single regex, one named group per agent."""
+        groups = []
+        self._keyword_agents = {}
+        for index, agent in enumerate(self.agents.values()):
+            if not agent.keywords:
+                continue
+            group = f"agent{index}"
+            self._keyword_agents[group] = agent.name
+            alternatives = "|".join(re.escape(kw.lower()) for kw in agent.keywords)
+            groups.append(f"(?P<{group}>{alternatives})")
+        # Case-sensitive over a lowercased message: re.IGNORECASE makes the
+        # alternation roughly 10x slower than the extra lower() copy costs
+        self._keyword_pattern = re.compile("|".join(groups)) if groups else None
 
     def list_agents(self) -> str:
         """List all registered agents."""
         if not self.agents:
             return "No agents registered."
 
-        result = "Available Agents:\n"
-        for name, agent in self.agents.items():
-            result += f"  - {name}: {agent.description}\n"
-        return result.strip()
+        if self._agents_summary is None:
+            self._agents_summary = "\n".join(
+                ["Available Agents:"]
+                + [f"  - {name}: {agent.description}" for name, agent in self.agents.items()]
+            )
+        return self._agents_summary
 
     def get_agent_capabilities(self) -> Dict[str, Any]:
-        """Get all agent capabilities for planning decisions."""
-        capabilities = {}
-        for name, agent in self.agents.items():
-            capabilities[name] = {
-                "description": agent.description,
-                "tools": [t.get("function", {}).get("name") for t in agent.tools if t.get("function")],
-            }
-        return capabilities
+        """Get all agent capabilities for planning decisions (shared; do not modify)."""
+        if self._capabilities is None:
+            capabilities = {}
+            for name, agent in self.agents.items():
+                capabilities[name] = {
+                    "description": agent.description,
+                    "tools": [t.get("function", {}).get("name") for t in agent.tools if t.get("function")],
+                }
+            self._capabilities = capabilities
+        return self._capabilities
 
     def clear_history(self, user_id: int) -> None:
         """Clear chat history for a specific user."""
-        if user_id in self.conversation_histories:
-            self.conversation_histories[user_id].clear()
+        with self._histories_lock:
+            chat_history = self.conversation_histories.get(user_id)
+        if chat_history is not None:
+            chat_history.clear()
 
     def _should_use_agent(self, user_message: str) -> Optional[str]:
         """Determine if an agent should be used based on message content."""
-        message_lower = user_message.lower()
-
-        # Check for report-related keywords
-        report_keywords = [
-            "report", "my reports", "list reports", "show report",
-            "update report", "edit report", "create report", "new report",
-            "submit report", "file a report", "make a report",
-            "water flow", "broken", "repair", "maintenance", "facilities issue"
-        ]
-        if any(kw in message_lower for kw in report_keywords):
-            if "report_agent" in self.agents:
-                return "report_agent"
+        if self._keyword_pattern is None:
+            return None
 
-        return None
+        # A single scan of the message finds the first keyword of any agent
+        match = self._keyword_pattern.search(user_message.lower())
+        if match is None:
+            return None
+        return self._keyword_agents[match.lastgroup]
 
-    def process_message(self, user_id: int, user_message: str) -> str:
-        """Process an incoming message and return the AI response."""
+    def _route_message(self, user_id: int, user_message: str) -> Tuple[ChatHistory, Optional[Agent]]:
+        """Record the user's message and pick the agent, if any, that should answer it."""
         # Get user's chat history
         chat_history = self.get_history(user_id)
 
         # Add user message to history
         chat_history.add_user_message(user_message)
 
-        orchestrator_logger.info(f"User {user_id}: {user_message[:100]}... (history_len={len(chat_history)})")
+        orchestrator_logger.info("User %s: %.100s... (history_len=%d)", user_id, user_message, len(chat_history))
 
         # Check if any agent should handle this message
         agent_name = self._should_use_agent(user_message)
 
         if agent_name and agent_name in self.agents:
-            agent = self.agents[agent_name]
-            orchestrator_logger.info(f"Routing to agent: {agent_name}")
+            orchestrator_logger.info("Routing to agent: %s", agent_name)
+            return chat_history, self.agents[agent_name]
+
+        return chat_history, None
+
+    def _run_agent(self, agent: Agent, chat_history: ChatHistory, user_id: int, user_message: str) -> str:
+        """Let an agent answer the message and record its reply."""
+        try:
+            # The agent builds its own request list, so it can read the live history
+            history_list = chat_history.get_history_view()
+
+            # Call the agent's chat function with user_id
+            orchestrator_logger.debug("Calling agent.chat_func with user_id=%s", user_id)
+            response, new_history = agent.chat_func(
+                user_message,
+                history_list,
+                max_turns=5,
+                user_id=user_id  # Pass user_id to the agent
+            )
 
-            try:
-                # Get history for agent (as list of message dicts)
-                history_list = chat_history.get_history()
+            # Update chat history with agent's response
+            chat_history.add_assistant_message(response)
 
-                # Call the agent's chat function with user_id
-                orchestrator_logger.debug(f"Calling agent.chat_func with user_id={user_id}")
-                response, new_history = agent.chat_func(
-                    user_message,
-                    history_list,
-                    max_turns=5,
-                    user_id=user_id  # Pass user_id to the agent
-                )
+            return response
 
-                # Update chat history with agent's response
-                chat_history.add_assistant_message(response)
+        except Exception as e:
+            orchestrator_logger.error("Agent error in %s: %s", agent.name, e)
+            return f"I apologize, but I encountered an error while processing your request: {str(e)}"
 
-                return response
+    def process_message(self, user_id: int, user_message: str) -> str:
+        """Process an incoming message and return the AI response."""
+        chat_history, agent = self._route_message(user_id, user_message)
 
-            except Exception as e:
-                orchestrator_logger.error(f"Agent error in {agent_name}: {e}")
-                return f"I apologize, but I encountered an error while processing your request: {str(e)}"
+        if agent is not None:
+            return self._run_agent(agent, chat_history, user_id, user_message)
 
         # Default: handle with general conversational AI
         return self._handle_conversation(user_id, user_message)
 
+    async def aprocess_message(self, user_id: int, user_message: str) -> str:
+        """Async variant of process_message for callers running on an event loop."""
+        chat_history, agent = self._route_message(user_id, user_message)
+
+        if agent is not None:
+            # Agents make blocking LLM and database calls, so they run in a thread
+            return await asyncio.to_thread(self._run_agent, agent, chat_history, user_id, user_message)
+
+        # Default: general conversation, awaiting the LLM without holding a thread
+        return await self._ahandle_conversation(user_id, user_message)
+
+    def _conversation_request(self, chat_history: ChatHistory, user_message: str) -> Tuple[str, List[Dict[str, str]]]:
+        """Pick the model and build the LLM messages for a general conversation turn."""
+        history = chat_history.history
+
+        if _is_simple(user_message):
+            recent = islice(history, max(len(history) - SIMPLE_HISTORY_MESSAGES, 0), None)
+            return SIMPLE_MODEL, [_SIMPLE_SYSTEM_MESSAGE, *recent]
+
+        return MODEL, [_CASUAL_SYSTEM_MESSAGE, *history]
+
+    def _conversation_reply(self, chat_history: ChatHistory, response: Any) -> str:
+        """Extract, clean and record the LLM's reply."""
+        content = response.choices[0].message.content or "I didn't understand that. Can you try again?"
+
+        # Clean content; most replies are already ASCII and skip the round-trip
+        if not content.isascii():
+            content = content.encode('ascii', 'ignore').decode('ascii')
+
+        # Add assistant response to history
+        chat_history.add_assistant_message(content)
+
+        return content
+
     def _handle_conversation(self, user_id: int, user_message: str) -> str:
         """Handle general conversation without specific agents."""
         chat_history = self.get_history(user_id)
-        history_list = chat_history.get_history()
 
-        casual_prompt = """You are a helpful AI assistant for a messaging application.
-Respond to the user's message in a friendly, helpful way.
-Keep your response concise and conversational.
-You can help with various tasks including managing reports and general questions.
-Plain text only, no special characters or emojis."""
+        model, messages = self._conversation_request(chat_history, user_message)
+        cache_key = _reply_cache_key(model, messages) if _is_simple(user_message) else None
+        cached = _cached_reply(cache_key)
+        if cached is not None:
+            chat_history.add_assistant_message(cached)
+            return cached
 
         try:
-            messages = [
-                {"role": "system", "content": casual_prompt},
-            ] + history_list
-
             response = completion(
-                model=MODEL,
+                model=model,
                 base_url=BASE_URL,
                 api_key=API_KEY,
                 messages=messages,
             )
+            content = self._conversation_reply(chat_history, response)
+            _store_reply(cache_key, content)
+            return content
 
-            content = response.choices[0].message.content or "I didn't understand that. Can you try again?"
+        except Exception as e:
+            orchestrator_logger.error("Conversation error: %s", e)
+            return "I apologize, but I'm having trouble responding right now. Please try again later."
 
-            # Clean content
-            content = content.encode('ascii', 'ignore').decode('ascii')
+    async def _ahandle_conversation(self, user_id: int, user_message: str) -> str:
+        """Async variant of _handle_conversation using litellm.acompletion."""
+        chat_history = self.get_history(user_id)
 
-            # Add assistant response to history
-            chat_history.add_assistant_message(content)
+        model, messages = self._conversation_request(chat_history, user_message)
+        cache_key = _reply_cache_key(model, messages) if _is_simple(user_message) else None
+        cached = _cached_reply(cache_key)
+        if cached is not None:
+            chat_history.add_assistant_message(cached)
+            return cached
 
+        try:
+            response = await acompletion(
+                model=model,
+                base_url=BASE_URL,
+                api_key=API_KEY,
+                messages=messages,
+            )
+            content = self._conversation_reply(chat_history, response)
+            _store_reply(cache_key, content)
             return content
 
         except Exception as e:
-            orchestrator_logger.error(f"Conversation error: {e}")
+            orchestrator_logger.error("Conversation error: %s", e)
             return "I apologize, but I'm having trouble responding right now. Please try again later."
 
     def handle_twilio_message(self, user_id: int, message_content: str) -> str:
         """Handle incoming Twilio message - wrapper for process_message."""
         return self.process_message(user_id, message_content)
 
+    async def ahandle_twilio_message(self, user_id: int, message_content: str) -> str:
+        """Handle incoming Twilio message - wrapper for aprocess_message."""
+        return await self.aprocess_message(user_id, message_content)
+
 
 # Global orchestrator instance
 _orchestrator: Optional[MessageOrchestrator] = None
+_orchestrator_lock = threading.Lock()
 
 
 def get_orchestrator() -> MessageOrchestrator:
     """Get or create the global orchestrator instance."""
     global _orchestrator
     if _orchestrator is None:
-        _orchestrator = MessageOrchestrator()
+        # Double-checked so concurrent first calls can't create two instances
+        with _orchestrator_lock:
+            if _orchestrator is None:
+                _orchestrator = MessageOrchestrator()
     return _orchestrator
 
 
@@ -305,17 +517,44 @@ def setup_orchestrator() -> MessageOrchestrator:
             tools=report_agent_module.TOOLS,
             available_functions=report_agent_module.AVAILABLE_FUNCTIONS,
             chat_func=report_agent_module.chat,
+            keywords=report_agent_module.KEYWORDS,
         )
 
         orchestrator.register_agent(report_agent_instance)
         orchestrator_logger.info("Report agent registered successfully")
 
     except Exception as e:
-        orchestrator_logger.error(f"Failed to register report agent: {e}")
+        orchestrator_logger.error("Failed to register report agent: %s", e)
 
     return orchestrator
 
 
+# Shared, bounded worker pool for AI replies to incoming messages. A burst of
+# messages queues here instead of tying up request threads or the event loop.
+# Created on first use and dropped on shutdown, so a later app lifespan in the
+# same process (e.g. a second TestClient) gets a fresh pool.
+_ai_executor: Optional[ThreadPoolExecutor] = None
+_ai_executor_lock = threading.Lock()
+
+
+def submit_ai_task(func: Callable, *args, **kwargs) -> Future:
+    """Run an AI processing task on the shared worker pool."""
+    global _ai_executor
+    with _ai_executor_lock:
+        if _ai_executor is None:
+            _ai_executor = ThreadPoolExecutor(max_workers=AI_TASK_WORKERS, thread_name_prefix="ai-task")
+        return _ai_executor.submit(func, *args, **kwargs)
+
+
+def shutdown_ai_tasks(wait: bool = True) -> None:
+    """Stop accepting AI tasks; by default wait for queued ones to finish."""
+    global _ai_executor
+    with _ai_executor_lock:
+        executor, _ai_executor = _ai_executor, None
+    if executor is not None:
+        executor.shutdown(wait=wait)
+
+
 if __name__ == "__main__":
     print("Message Orchestrator - Setup Test")
     print("=" * 50)
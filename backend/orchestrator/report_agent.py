@@ -17,14 +17,26 @@ import os
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from typing import List, Dict, Any, Tuple, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Sequence, Tuple, Optional
 from datetime import datetime
+from itertools import repeat
+import orjson
+from cachetools import TTLCache
 
 from litellm import completion
 
 # Import orchestrator logger for debugging
 from init_logs import orchestrator_logger
 
+# Configuration, read once at import (the orchestrator has already loaded .env).
+# HTTP connections are pooled by the shared litellm client the orchestrator installs.
+BASE_URL = os.environ.get("LITELLM_BASEURL", "")
+API_KEY = os.environ.get("LITELLM_API_KEY", "")
+MODEL = os.environ.get("LITELLM_MODEL", "gpt-3.5-turbo-1106")
+TOOL_WORKERS = int(os.environ.get("REPORT_TOOL_WORKERS", "8"))
+
 
 # =============================================================================
 # SYSTEM PROMPT - Defines the agent's behavior and capabilities
@@ -73,6 +85,17 @@ You: [CALLS create_report with title="Water flow issue at Building 1" and conten
 You: "Report created successfully! ID: #23"""
 
 
+# =============================================================================
+# KEYWORDS - Messages containing any of these are routed to this agent
+# =============================================================================
+KEYWORDS = (
+    "report", "my reports", "list reports", "show report",
+    "update report", "edit report", "create report", "new report",
+    "submit report", "file a report", "make a report",
+    "water flow", "broken", "repair", "maintenance", "facilities issue",
+)
+
+
 # =============================================================================
 # TOOLS - Define available functions for the LLM to call
 # =============================================================================
@@ -162,18 +185,91 @@ TOOLS = [
 ]
 
 
+# =============================================================================
+# FULL SYSTEM PROMPT - SYSTEM_PROMPT plus the function list, built once at import
+# =============================================================================
+# Deterministic tool order keeps the request prefix byte-identical across calls,
+# which provider-side prompt caching depends on; frozen so nothing can reorder it
+TOOLS = tuple(sorted(TOOLS, key=lambda tool: tool["function"]["name"]))
+
+_FN_DEFS = "\n".join(
+    f"- {tool['function']['name']}: {tool['function']['description']}"
+    for tool in TOOLS
+)
+_FULL_SYSTEM_PROMPT = f"{SYSTEM_PROMPT}\n\nAvailable functions:\n{_FN_DEFS}"
+
+# Static system messages, never mutated. Anthropic only caches blocks explicitly
+# marked with cache_control; other providers cache the stable prefix on their own.
+_SYSTEM_MESSAGE = {"role": "system", "content": _FULL_SYSTEM_PROMPT}
+_CACHED_SYSTEM_MESSAGE = {
+    "role": "system",
+    "content": [
+        {"type": "text", "text": _FULL_SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+    ],
+}
+
+
+def build_messages(
+    history: Sequence[Dict[str, str]],
+    user_message: str,
+    model: str = ""
+) -> List[Dict[str, Any]]:
+    """Static system prefix followed by the conversation; the prefix never varies per call."""
+    system_message = _CACHED_SYSTEM_MESSAGE if model.startswith("anthropic/") else _SYSTEM_MESSAGE
+    return [system_message, *history, {"role": "user", "content": user_message}]
+
+
 # =============================================================================
 # AVAILABLE FUNCTIONS - Will be populated by setup_orchestrator()
 # =============================================================================
 AVAILABLE_FUNCTIONS = {}
 
 
+# =============================================================================
+# TOOL EXECUTOR - Runs the tool calls of one turn concurrently
+# =============================================================================
+_tool_executor = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="report-tool")
+
+
 # =============================================================================
 # CHAT FUNCTION - Main entry point for the agent
 # =============================================================================
+def _invoke_tool(tool_call: Any, user_id: int) -> Dict[str, Any]:
+    """Run one tool call for the user and return its tool-result message."""
+    function_name = tool_call.function.name
+    function_args = tool_call.function.arguments
+
+    # Parse arguments safely
+    try:
+        args = orjson.loads(function_args) if isinstance(function_args, str) else function_args
+    except:
+        args = {}
+
+    orchestrator_logger.info("report_agent calling function: %s with user_id=%s, args=%s", function_name, user_id, args)
+
+    # Call the function with user_id
+    if function_name in AVAILABLE_FUNCTIONS:
+        func = AVAILABLE_FUNCTIONS[function_name]
+
+        # Pass user_id to all functions
+        result = func(user_id=user_id, **args)
+
+        orchestrator_logger.info("report_agent %s result: %.200s", function_name, result)
+    else:
+        result = f"Error: Function {function_name} not available"
+        orchestrator_logger.warning("report_agent function not found: %s", function_name)
+
+    return {
+        "role": "tool",
+        "tool_call_id": tool_call.id,
+        "name": function_name,
+        "content": result
+    }
+
+
 def chat(
     user_message: str,
-    history: List[Dict[str, str]],
+    history: Sequence[Dict[str, str]],
     max_turns: int = 5,
     user_id: int = None
 ) -> Tuple[str, List[Dict[str, str]]]:
@@ -182,38 +278,19 @@ def chat(
 
     Args:
         user_message: The user's message
-        history: List of previous messages in format [{"role": "user/assistant", "content": "..."}]
+        history: Previous messages in format [{"role": "user/assistant", "content": "..."}]; read-only
         max_turns: Maximum number of turns (default 5)
         user_id: The user ID for database operations (required)
 
     Returns:
         Tuple of (response_text, updated_history)
     """
-    import os
-    from litellm import completion
-
     # Validate user_id
     if user_id is None:
-        return "Error: User ID is required for report operations. Please try again.", history
-
-    # Get configuration
-    BASE_URL = os.environ.get("LITELLM_BASEURL", "")
-    API_KEY = os.environ.get("LITELLM_API_KEY", "")
-    MODEL = os.environ.get("LITELLM_MODEL", "gpt-3.5-turbo-1106")
+        return "Error: User ID is required for report operations. Please try again.", list(history)
 
     # Build messages array with system prompt, history, and user message
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT}
-    ] + history + [
-        {"role": "user", "content": user_message}
-    ]
-
-    # Add function definitions to system prompt
-    function_definitions = "\n".join([
-        f"- {tool['function']['name']}: {tool['function']['description']}"
-        for tool in TOOLS
-    ])
-    messages[0]["content"] += f"\n\nAvailable functions:\n{function_definitions}"
+    messages = build_messages(history, user_message, MODEL)
 
     try:
         response = completion(
@@ -221,7 +298,7 @@ def chat(
             base_url=BASE_URL,
             api_key=API_KEY,
             messages=messages,
-            tools=TOOLS,
+            tools=list(TOOLS),  # litellm expects a list and may adapt it in place
             tool_choice="auto"
         )
 
@@ -232,38 +309,12 @@ def chat(
         if tool_calls:
             messages.append(response_message)  # Add assistant's tool call message
 
-            for tool_call in tool_calls:
-                function_name = tool_call.function.name
-                function_args = tool_call.function.arguments
-
-                # Parse arguments safely
-                try:
-                    import json
-                    args = json.loads(function_args) if isinstance(function_args, str) else function_args
-                except:
-                    args = {}
-
-                orchestrator_logger.info(f"report_agent calling function: {function_name} with user_id={user_id}, args={args}")
-
-                # Call the function with user_id
-                if function_name in AVAILABLE_FUNCTIONS:
-                    func = AVAILABLE_FUNCTIONS[function_name]
-
-                    # Pass user_id to all functions
-                    result = func(user_id=user_id, **args)
-
-                    orchestrator_logger.info(f"report_agent {function_name} result: {str(result)[:200]}")
-                else:
-                    result = f"Error: Function {function_name} not available"
-                    orchestrator_logger.warning(f"report_agent function not found: {function_name}")
-
-                # Add function result to messages
-                messages.append({
-                    "role": "tool",
-                    "tool_call_id": tool_call.id,
-                    "name": function_name,
-                    "content": result
-                })
+            # Each tool opens its own Session. A single call runs inline; independent
+            # calls overlap their DB round-trips on the pool. map() keeps call order.
+            if len(tool_calls) == 1:
+                messages.append(_invoke_tool(tool_calls[0], user_id))
+            else:
+                messages.extend(_tool_executor.map(_invoke_tool, tool_calls, repeat(user_id)))
 
             # Get final response after tool execution
             second_response = completion(
@@ -276,11 +327,13 @@ def chat(
         else:
             content = response_message.content or ""
 
-        # Clean content (remove special characters)
-        content = content.encode('ascii', 'ignore').decode('ascii')
+        # Clean content (remove special characters); most replies are already ASCII and skip the round-trip
+        if not content.isascii():
+            content = content.encode('ascii', 'ignore').decode('ascii')
 
         # Update history
-        updated_history = history + [
+        updated_history = [
+            *history,
             {"role": "user", "content": user_message},
             {"role": "assistant", "content": content}
         ]
@@ -290,52 +343,75 @@ def chat(
     except Exception as e:
         error_msg = f"Error in report agent: {str(e)}"
         orchestrator_logger.error(error_msg)
-        return error_msg, history + [{"role": "user", "content": user_message}, {"role": "assistant", "content": error_msg}]
+        return error_msg, [*history, {"role": "user", "content": user_message}, {"role": "assistant", "content": error_msg}]
 
 
 # =============================================================================
 # DATABASE HELPER FUNCTIONS - These are set by setup_orchestrator()
 # =============================================================================
-def _get_db_session():
-    """Get a database session."""
-    from db.config import get_db
-    return next(get_db())
+# (user_id, status_filter) -> rendered report list; short-lived and dropped for
+# the user whenever one of their reports changes, here or through the reports API
+# (per process, so other workers may serve a list up to the TTL old)
+_reports_cache = TTLCache(maxsize=256, ttl=5)
+_reports_cache_lock = threading.Lock()
+
+# Separator between reports in tool output
+_SEP = "-" * 30
+
+
+def invalidate_reports_cache(user_id: int) -> None:
+    """Drop cached report lists for a user after their reports change."""
+    with _reports_cache_lock:
+        for key in [key for key in _reports_cache.keys() if key[0] == user_id]:
+            _reports_cache.pop(key, None)
 
 
 def get_my_reports(user_id: int, status_filter: str = None):
     """Get all reports for a user."""
+    from db.config import SessionLocal
     from db.models import Report
 
-    db = _get_db_session()
-    try:
-        query = db.query(Report).filter(Report.reporter_id == user_id)
+    cache_key = (user_id, status_filter)
+    with _reports_cache_lock:
+        cached = _reports_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    with SessionLocal() as db:
+        # Only the listed columns; content/comment stay in the database
+        query = db.query(
+            Report.id, Report.title, Report.status, Report.created_at
+        ).filter(Report.reporter_id == user_id)
         if status_filter:
             query = query.filter(Report.status == status_filter)
 
-        reports = query.order_by(Report.created_at.desc()).all()
+        reports = query.order_by(Report.created_at.desc(), Report.id.desc()).all()
 
-        if not reports:
-            return "You have no reports."
+    if not reports:
+        return "You have no reports."
 
-        result = f"Your Reports:\n\n"
-        for report in reports:
-            result += f"ID: #{report.id}\n"
-            result += f"Title: {report.title}\n"
-            result += f"Status: {report.status}\n"
-            result += f"Created: {report.created_at.strftime('%Y-%m-%d %H:%M')}\n"
-            result += "-" * 30 + "\n"
+    parts = ["Your Reports:\n\n"]
+    for report in reports:
+        parts.append(
+            f"ID: #{report.id}\n"
+            f"Title: {report.title}\n"
+            f"Status: {report.status}\n"
+            f"Created: {report.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+            f"{_SEP}\n"
+        )
+    result = "".join(parts)
 
-        return result
-    finally:
-        db.close()
+    with _reports_cache_lock:
+        _reports_cache[cache_key] = result
+    return result
 
 
 def get_report(user_id: int, report_id: int):
     """Get details of a specific report."""
+    from db.config import SessionLocal
     from db.models import Report
 
-    db = _get_db_session()
-    try:
+    with SessionLocal() as db:
         report = db.query(Report).filter(
             Report.id == report_id,
             Report.reporter_id == user_id
@@ -344,78 +420,78 @@ def get_report(user_id: int, report_id: int):
         if not report:
             return f"Report #{report_id} not found or you don't have access to it."
 
-        result = f"Report Details:\n\n"
-        result += f"ID: #{report.id}\n"
-        result += f"Title: {report.title}\n"
-        result += f"Content: {report.content}\n"
-        result += f"Status: {report.status}\n"
-        result += f"Created: {report.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+        parts = [
+            "Report Details:\n\n"
+            f"ID: #{report.id}\n"
+            f"Title: {report.title}\n"
+            f"Content: {report.content}\n"
+            f"Status: {report.status}\n"
+            f"Created: {report.created_at.strftime('%Y-%m-%d %H:%M')}\n"
+        ]
 
         if report.comment:
-            result += f"\nAdmin Comment: {report.comment}\n"
+            parts.append(f"\nAdmin Comment: {report.comment}\n")
 
         if report.resolved_by:
-            result += f"Resolved at: {report.resolved_at.strftime('%Y-%m-%d %H:%M')}\n"
+            parts.append(f"Resolved at: {report.resolved_at.strftime('%Y-%m-%d %H:%M')}\n")
 
-        return result
-    finally:
-        db.close()
+        return "".join(parts)
 
 
 def create_report(user_id: int, title: str, content: str):
     """Create a new report."""
+    from db.config import SessionLocal
     from db.models import Report
 
-    db = _get_db_session()
-    try:
-        report = Report(
-            reporter_id=user_id,
-            title=title,
-            content=content,
-            status="open"
-        )
-        db.add(report)
-        db.commit()
-        db.refresh(report)
+    with SessionLocal() as db:
+        try:
+            report = Report(
+                reporter_id=user_id,
+                title=title,
+                content=content,
+                status="open"
+            )
+            db.add(report)
+            db.commit()
+            db.refresh(report)
+        except Exception as e:
+            db.rollback()
+            return f"Error creating report: {str(e)}"
 
-        return f"Report created successfully!\n\nID: #{report.id}\nTitle: {report.title}\nStatus: open\n\nYour report has been submitted and will be reviewed by the admin."
-    except Exception as e:
-        db.rollback()
-        return f"Error creating report: {str(e)}"
-    finally:
-        db.close()
+    invalidate_reports_cache(user_id)
+    return f"Report created successfully!\n\nID: #{report.id}\nTitle: {report.title}\nStatus: open\n\nYour report has been submitted and will be reviewed by the admin."
 
 
 def update_report(user_id: int, report_id: int, title: str = None, content: str = None):
     """Update an existing report (only open reports can be modified)."""
+    from db.config import SessionLocal
     from db.models import Report
 
-    db = _get_db_session()
-    try:
-        report = db.query(Report).filter(
-            Report.id == report_id,
-            Report.reporter_id == user_id
-        ).first()
-
-        if not report:
-            return f"Report #{report_id} not found or you don't have access to it."
-
-        if report.status != "open":
-            return f"Cannot update report #{report_id}. Only open reports can be modified. Current status: {report.status}"
-
-        updates = []
-        if title:
-            report.title = title
-            updates.append("title")
-        if content:
-            report.content = content
-            updates.append("content")
-
-        db.commit()
-
-        return f"Report #{report_id} updated successfully!\nUpdated fields: {', '.join(updates)}\n\nNew content:\nTitle: {report.title}\nContent: {report.content}"
-    except Exception as e:
-        db.rollback()
-        return f"Error updating report: {str(e)}"
-    finally:
-        db.close()
\ No newline at end of file
+    with SessionLocal() as db:
+        try:
+            report = db.query(Report).filter(
+                Report.id == report_id,
+                Report.reporter_id == user_id
+            ).first()
+
+            if not report:
+                return f"Report #{report_id} not found or you don't have access to it."
+
+            if report.status != "open":
+                return f"Cannot update report #{report_id}. Only open reports can be modified. Current status: {report.status}"
+
+            updates = []
+            if title:
+                report.title = title
+                updates.append("title")
+            if content:
+                report.content = content
+                updates.append("content")
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            return f"Error updating report: {str(e)}"
+
+    invalidate_reports_cache(user_id)
+    return f"Report #{report_id} updated successfully!\nUpdated fields: {', '.join(updates)}\n\nNew content:\nTitle: {report.title}\nContent: {report.content}"
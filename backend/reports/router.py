@@ -2,27 +2,43 @@ import logging
 from datetime import datetime
 from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, aliased
 
 from db.config import get_db
 from db.models import User, Report
 from auth.schemas import (
     ReportCreate, ReportUpdate, ReportResponse, ReportListResponse, ReportCommentRequest
 )
-from auth.utils import get_current_user, require_superuser
+from auth.utils import TokenUser, get_current_principal, require_superuser
+from orchestrator.report_agent import invalidate_reports_cache
 
 router = APIRouter(prefix="/reports", tags=["Reports"])
 
+# Handlers are plain `def` so the blocking Session runs in FastAPI's threadpool
+
 # Reports module logger
 reports_logger = logging.getLogger("reports")
 
+# Reporter/resolver usernames are joined into the report query instead of being
+# looked up one report at a time
+_Reporter = aliased(User, name="reporter")
+_Resolver = aliased(User, name="resolver")
+
+# List endpoints select plain columns rather than Report entities, skipping ORM
+# object construction and identity-map bookkeeping for every row
+_REPORT_LIST_COLUMNS = (
+    Report.id, Report.reporter_id, Report.title, Report.content, Report.status,
+    Report.comment, Report.resolved_at, Report.resolved_by,
+    Report.created_at, Report.updated_at,
+)
+
 
 # ==================== USER REPORT ENDPOINTS ====================
 
 @router.post("", response_model=ReportResponse, status_code=status.HTTP_201_CREATED)
-async def create_report(
+def create_report(
     report_data: ReportCreate,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Create a new report (any authenticated user)"""
@@ -36,6 +52,7 @@ async def create_report(
     db.add(report)
     db.commit()
     db.refresh(report)
+    invalidate_reports_cache(report.reporter_id)
     
     reports_logger.info(f"Report created by user {current_user.username}: {report.id}")
     
@@ -43,56 +60,53 @@ async def create_report(
 
 
 @router.get("", response_model=list[ReportListResponse])
-async def get_my_reports(
+def get_my_reports(
     status_filter: Optional[str] = None,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get all reports created by the current user"""
-    query = db.query(Report).filter(Report.reporter_id == current_user.id)
+    query = (
+        db.query(*_REPORT_LIST_COLUMNS, _Resolver.username.label("resolver_username"))
+        .select_from(Report)
+        .outerjoin(_Resolver, _Resolver.id == Report.resolved_by)
+        .filter(Report.reporter_id == current_user.id)
+    )
     
     if status_filter:
         query = query.filter(Report.status == status_filter)
     
-    reports = query.order_by(Report.created_at.desc()).all()
+    rows = query.order_by(Report.created_at.desc(), Report.id.desc()).all()
     
-    result = []
-    for report in reports:
-        resolver = db.query(User).filter(User.id == report.resolved_by).first() if report.resolved_by else None
-        
-        result.append(ReportListResponse(
-            id=report.id,
-            reporter_id=report.reporter_id,
-            reporter_username=current_user.username,
-            title=report.title,
-            content=report.content,
-            status=report.status,
-            comment=report.comment,
-            resolved_at=report.resolved_at,
-            resolved_by=report.resolved_by,
-            resolver_username=resolver.username if resolver else None,
-            created_at=report.created_at,
-            updated_at=report.updated_at
-        ))
-    
-    return result
+    return [
+        ReportListResponse(reporter_username=current_user.username, **row._mapping)
+        for row in rows
+    ]
 
 
 @router.get("/{report_id}", response_model=ReportListResponse)
-async def get_report(
+def get_report(
     report_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Get a specific report (only if created by current user or is superuser)"""
-    report = db.query(Report).filter(Report.id == report_id).first()
+    row = (
+        db.query(Report, _Reporter.username, _Resolver.username)
+        .outerjoin(_Reporter, _Reporter.id == Report.reporter_id)
+        .outerjoin(_Resolver, _Resolver.id == Report.resolved_by)
+        .filter(Report.id == report_id)
+        .first()
+    )
     
-    if not report:
+    if not row:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Report not found"
         )
     
+    report, reporter_username, resolver_username = row
+    
     # Check if user is the reporter or superuser
     if report.reporter_id != current_user.id and not current_user.is_superuser:
         raise HTTPException(
@@ -100,30 +114,27 @@ async def get_report(
             detail="Not authorized to view this report"
         )
     
-    reporter = db.query(User).filter(User.id == report.reporter_id).first()
-    resolver = db.query(User).filter(User.id == report.resolved_by).first() if report.resolved_by else None
-    
     return ReportListResponse(
         id=report.id,
         reporter_id=report.reporter_id,
-        reporter_username=reporter.username if reporter else None,
+        reporter_username=reporter_username,
         title=report.title,
         content=report.content,
         status=report.status,
         comment=report.comment,
         resolved_at=report.resolved_at,
         resolved_by=report.resolved_by,
-        resolver_username=resolver.username if resolver else None,
+        resolver_username=resolver_username,
         created_at=report.created_at,
         updated_at=report.updated_at
     )
 
 
 @router.put("/{report_id}", response_model=ReportResponse)
-async def update_report(
+def update_report(
     report_id: int,
     report_data: ReportUpdate,
-    current_user: User = Depends(get_current_user),
+    current_user: TokenUser = Depends(get_current_principal),
     db: Session = Depends(get_db)
 ):
     """Update a report (only if created by current user and status is open)"""
@@ -154,6 +165,7 @@ async def update_report(
     
     db.commit()
     db.refresh(report)
+    invalidate_reports_cache(report.reporter_id)
     
     reports_logger.info(f"Report {report.id} updated by user {current_user.username}")
     
@@ -163,47 +175,36 @@ async def update_report(
 # ==================== SUPERUSER REPORT ENDPOINTS ====================
 
 @router.get("/admin/all", response_model=list[ReportListResponse])
-async def get_all_reports(
+def get_all_reports(
     status_filter: Optional[str] = None,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Get all reports (superuser only)"""
-    query = db.query(Report)
+    query = (
+        db.query(
+            *_REPORT_LIST_COLUMNS,
+            _Reporter.username.label("reporter_username"),
+            _Resolver.username.label("resolver_username"),
+        )
+        .select_from(Report)
+        .outerjoin(_Reporter, _Reporter.id == Report.reporter_id)
+        .outerjoin(_Resolver, _Resolver.id == Report.resolved_by)
+    )
     
     if status_filter:
         query = query.filter(Report.status == status_filter)
     
-    reports = query.order_by(Report.created_at.desc()).all()
+    rows = query.order_by(Report.created_at.desc(), Report.id.desc()).all()
     
-    result = []
-    for report in reports:
-        reporter = db.query(User).filter(User.id == report.reporter_id).first()
-        resolver = db.query(User).filter(User.id == report.resolved_by).first() if report.resolved_by else None
-        
-        result.append(ReportListResponse(
-            id=report.id,
-            reporter_id=report.reporter_id,
-            reporter_username=reporter.username if reporter else None,
-            title=report.title,
-            content=report.content,
-            status=report.status,
-            comment=report.comment,
-            resolved_at=report.resolved_at,
-            resolved_by=report.resolved_by,
-            resolver_username=resolver.username if resolver else None,
-            created_at=report.created_at,
-            updated_at=report.updated_at
-        ))
-    
-    return result
+    return [ReportListResponse(**row._mapping) for row in rows]
 
 
 @router.post("/{report_id}/comment", response_model=ReportResponse)
-async def add_report_comment(
+def add_report_comment(
     report_id: int,
     comment_data: ReportCommentRequest,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Add a comment to a report and optionally change status (superuser only)"""
@@ -233,6 +234,7 @@ async def add_report_comment(
     
     db.commit()
     db.refresh(report)
+    invalidate_reports_cache(report.reporter_id)
     
     reports_logger.info(f"Report {report_id} commented by superuser {current_user.username}, status: {report.status}")
     
@@ -240,10 +242,10 @@ async def add_report_comment(
 
 
 @router.put("/{report_id}/resolve", response_model=ReportResponse)
-async def resolve_report(
+def resolve_report(
     report_id: int,
     comment_data: ReportCommentRequest,
-    current_user: User = Depends(require_superuser),
+    current_user: TokenUser = Depends(require_superuser),
     db: Session = Depends(get_db)
 ):
     """Resolve a report with a comment (superuser only)"""
@@ -264,6 +266,7 @@ async def resolve_report(
     
     db.commit()
     db.refresh(report)
+    invalidate_reports_cache(report.reporter_id)
     
     reports_logger.info(f"Report {report_id} resolved by superuser {current_user.username}")
     
@@ -3,6 +3,7 @@ Test module for authentication utilities.
 Run with: python -m pytest backend/tests/test_auth.py -v
 """
 import pytest
+from types import SimpleNamespace
 from datetime import datetime, timedelta
 import sys
 import os
@@ -12,13 +13,23 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
+from fastapi import HTTPException
+
 from auth.utils import (
     get_password_hash, 
     verify_password, 
+    needs_rehash,
     create_access_token, 
     create_refresh_token, 
     decode_token,
-    generate_session_token
+    generate_session_token,
+    is_login_throttled,
+    record_failed_login,
+    clear_failed_logins,
+    require_superuser,
+    get_current_principal,
+    invalidate_cached_user,
+    LOGIN_MAX_FAILED_ATTEMPTS
 )
 
 
@@ -51,6 +62,15 @@ class TestPasswordHashing:
         
         assert not verify_password("wrongpassword", hashed)
     
+    def test_needs_rehash(self):
+        """Test detection of hashes made with other bcrypt settings"""
+        import bcrypt
+        
+        assert needs_rehash(get_password_hash("pw")) is False
+        weak = bcrypt.hashpw(b"pw", bcrypt.gensalt(rounds=4)).decode('utf-8')
+        assert needs_rehash(weak) is True
+        assert needs_rehash("not-a-bcrypt-hash") is True
+    
     def test_verify_password_empty(self):
         """Test verify_password with empty password"""
         password = "testpassword123"
@@ -114,6 +134,47 @@ class TestTokenDecoding:
         assert payload["username"] == "testuser"
         assert payload["type"] == "refresh"
     
+    def test_decode_superuser_claim(self):
+        """Test that access tokens carry the superuser flag"""
+        assert decode_token(create_access_token(user_id=1, username="admin", is_superuser=True))["is_superuser"] is True
+        assert decode_token(create_access_token(user_id=2, username="testuser"))["is_superuser"] is False
+    
+    def test_require_superuser_allows_database_superuser(self):
+        """Test that the superuser role stored in the database grants access"""
+        db = _CountingSession(SimpleNamespace(is_active=True, username="admin", is_superuser=True))
+        token = create_access_token(user_id=503, username="admin", is_superuser=True)
+        user = require_superuser(token, db)
+        
+        assert user.id == 503
+        assert user.username == "admin"
+        assert user.is_superuser is True
+    
+    def test_require_superuser_ignores_stale_claim(self):
+        """Test that a superuser claim does not outlive demoting the account"""
+        db = _CountingSession(SimpleNamespace(is_active=True, username="admin", is_superuser=False))
+        token = create_access_token(user_id=506, username="admin", is_superuser=True)
+        
+        with pytest.raises(HTTPException) as exc:
+            require_superuser(token, db)
+        assert exc.value.status_code == 403
+    
+    def test_require_superuser_rejects_disabled_account(self):
+        """Test that a superuser claim does not outlive disabling the account"""
+        db = _CountingSession(SimpleNamespace(is_active=False, username="admin", is_superuser=True))
+        token = create_access_token(user_id=504, username="admin", is_superuser=True)
+        
+        with pytest.raises(HTTPException) as exc:
+            require_superuser(token, db)
+        assert exc.value.status_code == 403
+    
+    def test_require_superuser_rejects_deleted_account(self):
+        """Test that a superuser claim does not outlive deleting the account"""
+        token = create_access_token(user_id=505, username="admin", is_superuser=True)
+        
+        with pytest.raises(HTTPException) as exc:
+            require_superuser(token, _CountingSession(None))
+        assert exc.value.status_code == 401
+    
     def test_decode_invalid_token(self):
         """Test decoding invalid token"""
         payload = decode_token("invalid_token")
@@ -130,6 +191,139 @@ class TestTokenDecoding:
         assert payload is None
 
 
+class TestHS256FastPath:
+    """Test the hmac-based HS256 verification path"""
+    
+    def test_fast_path_matches_jose(self):
+        """Test that the fast path returns the same payload as jose"""
+        from jose import jwt
+        from auth.utils import _decode_hs256, SECRET_KEY, ALGORITHM
+        
+        token = create_access_token(user_id=3, username="fast", is_superuser=True)
+        assert _decode_hs256(token) == jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    
+    def test_tampered_token_rejected(self):
+        """Test that a modified payload fails signature verification"""
+        import base64
+        import json
+        
+        token = create_access_token(user_id=4, username="tamper")
+        header, _, signature = token.split(".")
+        forged = base64.urlsafe_b64encode(
+            json.dumps({"sub": "1", "username": "admin", "type": "access", "is_superuser": True}).encode()
+        ).decode().rstrip("=")
+        
+        assert decode_token(f"{header}.{forged}.{signature}") is None
+    
+    def test_expired_token_rejected(self):
+        """Test that an expired token is rejected"""
+        token = create_access_token(user_id=5, username="expired", expires_delta=timedelta(seconds=-10))
+        assert decode_token(token) is None
+    
+    def test_foreign_claims_fall_back_to_jose(self):
+        """Test that tokens with extra claims are still verified by jose"""
+        from jose import jwt
+        from auth.utils import SECRET_KEY, ALGORITHM
+        
+        token = jwt.encode(
+            {"sub": "6", "type": "access", "iat": 1700000000},
+            SECRET_KEY, algorithm=ALGORITHM
+        )
+        assert decode_token(token)["sub"] == "6"
+
+
+class TestTokenCache:
+    """Test caching of verified token payloads"""
+    
+    def test_decode_cached_token(self):
+        """Test that decoding the same token twice returns the same payload"""
+        token = create_access_token(user_id=1, username="testuser")
+        first = decode_token(token)
+        second = decode_token(token)
+        
+        assert first is not None
+        assert second == first
+    
+    def test_cached_token_bounded_by_exp(self):
+        """Test that a cache entry never outlives the token's exp claim"""
+        from auth.utils import _token_cache, _token_cache_key
+        
+        token = create_access_token(user_id=1, username="testuser", expires_delta=timedelta(seconds=5))
+        payload = decode_token(token)
+        
+        assert _token_cache[_token_cache_key(token)][1] <= payload["exp"]
+    
+    def test_invalid_token_not_cached(self):
+        """Test that a failed verification is repeated on every call"""
+        assert decode_token("invalid_token") is None
+        assert decode_token("invalid_token") is None
+
+
+class _CountingSession:
+    """Minimal session stand-in that counts primary-key lookups"""
+    
+    def __init__(self, user):
+        self.user = user
+        self.gets = 0
+    
+    def get(self, model, ident):
+        self.gets += 1
+        return self.user
+
+
+class TestPrincipalCache:
+    """Test caching of the current user's auth state"""
+    
+    def test_principal_cached_until_invalidated(self):
+        """Test that the user row is loaded once and reloaded after invalidation"""
+        user = SimpleNamespace(is_active=True, username="cached", is_superuser=False)
+        db = _CountingSession(user)
+        token = create_access_token(user_id=501, username="cached")
+        
+        assert get_current_principal(token, db).username == "cached"
+        assert get_current_principal(token, db).id == 501
+        assert db.gets == 1
+        
+        invalidate_cached_user(501)
+        get_current_principal(token, db)
+        assert db.gets == 2
+    
+    def test_disabled_principal_rejected(self):
+        """Test that a disabled user is refused"""
+        db = _CountingSession(SimpleNamespace(is_active=False, username="off", is_superuser=False))
+        token = create_access_token(user_id=502, username="off")
+        
+        with pytest.raises(HTTPException) as exc:
+            get_current_principal(token, db)
+        assert exc.value.status_code == 403
+
+
+class TestLoginThrottle:
+    """Test throttling of repeated failed logins"""
+    
+    def test_not_throttled_below_limit(self):
+        """Test that a client is allowed until the limit is reached"""
+        for _ in range(LOGIN_MAX_FAILED_ATTEMPTS - 1):
+            record_failed_login("10.0.0.1", "below_limit")
+        assert is_login_throttled("10.0.0.1", "below_limit") is False
+    
+    def test_throttled_at_limit(self):
+        """Test that a client is throttled once the limit is reached"""
+        for _ in range(LOGIN_MAX_FAILED_ATTEMPTS):
+            record_failed_login("10.0.0.2", "at_limit")
+        assert is_login_throttled("10.0.0.2", "at_limit") is True
+        # Other clients and usernames are unaffected
+        assert is_login_throttled("10.0.0.3", "at_limit") is False
+        assert is_login_throttled("10.0.0.2", "other_user") is False
+    
+    def test_clear_failed_logins(self):
+        """Test that a successful login resets the counter"""
+        for _ in range(LOGIN_MAX_FAILED_ATTEMPTS):
+            record_failed_login("10.0.0.4", "cleared")
+        clear_failed_logins("10.0.0.4", "cleared")
+        assert is_login_throttled("10.0.0.4", "cleared") is False
+
+
 class TestSessionToken:
     """Test session token generation"""
     
@@ -261,6 +455,20 @@ class TestPhoneNumberUpdate:
         # Check that phone_number column allows null
         phone_column = User.__table__.columns.get('phone_number')
         assert phone_column is not None
+    
+    def test_phone_normalized_from_phone_number(self):
+        """Test that phone_normalized keeps only the digits of phone_number"""
+        from db.models import User
+        user = User(username="phoneuser", email="phone@example.com", hashed_password="x")
+        user.phone_number = "+1 (555) 010-2030"
+        assert user.phone_normalized == "15550102030"
+        user.phone_number = None
+        assert user.phone_normalized is None
+    
+    def test_phone_normalized_unique(self):
+        """Test that differently formatted copies of a number cannot coexist"""
+        from db.models import User
+        assert User.__table__.columns.get('phone_normalized').unique
 
 
 # ==================== RUNNER ====================
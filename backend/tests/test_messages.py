@@ -20,7 +20,7 @@ from unittest.mock import patch, MagicMock
 from main import app
 from db.config import Base, get_db
 from db.models import User, Message
-from auth.utils import create_access_token
+from auth.utils import create_access_token, _user_cache
 
 
 # Test database setup
@@ -100,6 +100,7 @@ class TestMessagesIntegration:
         Base.metadata.create_all(bind=engine)
         yield
         Base.metadata.drop_all(bind=engine)
+        _user_cache.clear()  # user ids are reused across tests
 
     @pytest.fixture
     def test_user(self):
@@ -693,6 +694,33 @@ class TestMessagesIntegration:
         # Note: TestClient may return 422 for PUT without body, but endpoint works correctly
         assert response.status_code in [200, 422]
 
+    def test_mark_all_read_returns_count(self, test_user, test_user2, auth_headers):
+        """Test that mark all read reports how many messages were updated"""
+        user2_token = create_access_token(user_id=test_user2, username="testuser2")
+        user2_headers = {"Authorization": f"Bearer {user2_token}"}
+        
+        client = TestClient(app)
+        for i in range(2):
+            client.post(
+                "/messages",
+                json={"recipient_id": test_user2, "content": f"Message {i}"},
+                headers=auth_headers
+            )
+        
+        response = client.put("/messages/read-all", headers=user2_headers)
+        assert response.status_code == 200
+        assert response.json()["updated_count"] == 2
+        
+        response = client.put("/messages/read-all", headers=user2_headers)
+        assert response.json()["updated_count"] == 0
+
+    def test_mark_message_read_not_found(self, auth_headers):
+        """Test marking a non-existent message as read"""
+        client = TestClient(app)
+        response = client.put("/messages/99999/read", headers=auth_headers)
+        assert response.status_code == 404
+        assert "Message not found" in response.json()["detail"]
+
     def test_get_unread_count_multiple_users(self, test_user, test_user2, auth_headers):
         """Test unread count is user-specific"""
         # Send messages to user2
@@ -747,6 +775,7 @@ class TestMessagesEdgeCases:
         Base.metadata.create_all(bind=engine)
         yield
         Base.metadata.drop_all(bind=engine)
+        _user_cache.clear()  # user ids are reused across tests
 
     @pytest.fixture
     def test_user(self):
@@ -895,6 +924,56 @@ class TestMessagesEdgeCases:
         assert message_id not in [m["id"] for m in received_response.json()]
 
 
+class TestTwilioPhoneMatch:
+    """Test matching an incoming Twilio number to a user"""
+
+    @pytest.fixture(autouse=True)
+    def setup_database(self):
+        """Create tables before each test"""
+        Base.metadata.create_all(bind=engine)
+        yield
+        Base.metadata.drop_all(bind=engine)
+
+    def _add_user(self, username, phone_number):
+        """Create a user with a phone number and return its id"""
+        db = TestingSessionLocal()
+        user = User(
+            username=username,
+            email=f"{username}@example.com",
+            hashed_password="hashed_password",
+            phone_number=phone_number
+        )
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+        return user_id
+
+    def test_suffix_match_without_country_code(self):
+        """Test that a number missing its country code matches on the trailing digits"""
+        from main import _save_twilio_message
+
+        user_id = self._add_user("local", "+60 12-345 6789")
+        db = TestingSessionLocal()
+        try:
+            assert _save_twilio_message(db, "0123456789", "hi", "SM1")[0] == user_id
+        finally:
+            db.close()
+
+    def test_ambiguous_suffix_matches_nobody(self):
+        """Test that trailing digits shared by two users resolve to no one"""
+        from main import _save_twilio_message
+
+        self._add_user("us", "+1 234-567-8901")
+        self._add_user("uk", "+44 234-567-8901")
+        db = TestingSessionLocal()
+        try:
+            assert _save_twilio_message(db, "234-567-8901", "hi", "SM1") is None
+            assert db.query(Message).count() == 0
+        finally:
+            db.close()
+
+
 # ==================== RUNNER ====================
 
 if __name__ == "__main__":
@@ -0,0 +1,403 @@
+"""
+Test module for the message orchestrator.
+Run with: python -m pytest backend/tests/test_orchestrator.py -v
+"""
+import pytest
+import asyncio
+import sys
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+# Add project root to path
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+import orchestrator
+from orchestrator import Agent, ChatHistory, MessageOrchestrator
+
+
+@pytest.fixture(autouse=True)
+def clear_reply_cache():
+    """Start every test with an empty simple-reply cache"""
+    orchestrator._reply_cache.clear()
+    yield
+    orchestrator._reply_cache.clear()
+
+
+def _llm_response(content):
+    """Minimal stand-in for a litellm completion response"""
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _make_agent(name, keywords=()):
+    """Build an agent whose chat function is never called in these tests"""
+    return Agent(
+        name=name,
+        description=f"{name} agent",
+        system_prompt="",
+        tools=[],
+        available_functions={},
+        chat_func=lambda *args, **kwargs: ("", []),
+        keywords=keywords,
+    )
+
+
+class TestChatHistory:
+    """Test the bounded per-user chat history"""
+
+    def test_keeps_most_recent_entries(self):
+        """Test that the oldest entries are dropped past max_entries"""
+        history = ChatHistory(max_entries=3)
+        for i in range(5):
+            history.add_user_message(f"message {i}")
+
+        assert len(history) == 3
+        assert [m["content"] for m in history.get_history()] == ["message 2", "message 3", "message 4"]
+
+    def test_ignores_other_roles(self):
+        """Test that only user and assistant messages are stored"""
+        history = ChatHistory()
+        history.add_message("system", "ignored")
+        history.add_message("assistant", "kept")
+
+        assert history.get_history() == [{"role": "assistant", "content": "kept"}]
+
+    def test_clear(self):
+        """Test clearing history keeps it usable"""
+        history = ChatHistory(max_entries=2)
+        history.add_user_message("hello")
+        history.clear()
+        history.add_assistant_message("hi")
+
+        assert len(history) == 1
+
+
+class TestConversationHistories:
+    """Test the per-user history store on the orchestrator"""
+
+    def test_get_history_reuses_instance(self):
+        """Test that a user keeps the same history across calls"""
+        instance = MessageOrchestrator()
+        assert instance.get_history(1) is instance.get_history(1)
+        assert instance.get_history(1) is not instance.get_history(2)
+
+    def test_idle_history_expires(self, monkeypatch):
+        """Test that histories are dropped once idle past the TTL"""
+        monkeypatch.setattr(orchestrator, "CHAT_HISTORY_TTL_SECONDS", 0.05)
+        instance = MessageOrchestrator()
+        instance.get_history(1).add_user_message("hello")
+
+        time.sleep(0.1)
+
+        assert len(instance.get_history(1)) == 0
+
+    def test_user_limit(self, monkeypatch):
+        """Test that the least recently used histories go past the user limit"""
+        monkeypatch.setattr(orchestrator, "CHAT_HISTORY_USERS_MAX", 2)
+        instance = MessageOrchestrator()
+        for user_id in range(3):
+            instance.get_history(user_id).add_user_message("hello")
+
+        assert 0 not in instance.conversation_histories
+        assert len(instance.conversation_histories) == 2
+
+
+class TestAgentRouting:
+    """Test keyword-based agent selection"""
+
+    def test_no_agents(self):
+        """Test that nothing is routed before agents are registered"""
+        orchestrator = MessageOrchestrator()
+        assert orchestrator._should_use_agent("please make a report") is None
+
+    def test_keyword_routes_to_agent(self):
+        """Test that a keyword anywhere in the message selects its agent"""
+        orchestrator = MessageOrchestrator()
+        orchestrator.register_agent(_make_agent("report_agent", ("report", "Water Flow")))
+
+        assert orchestrator._should_use_agent("Show me my reports") == "report_agent"
+        assert orchestrator._should_use_agent("The WATER FLOW stopped") == "report_agent"
+        assert orchestrator._should_use_agent("hello there") is None
+
+    def test_capabilities_rebuilt_on_register(self):
+        """Test that cached capabilities and listing pick up newly registered agents"""
+        instance = MessageOrchestrator()
+        agent = _make_agent("report_agent")
+        agent.tools = [{"type": "function", "function": {"name": "create_report"}}]
+        instance.register_agent(agent)
+
+        assert instance.get_agent_capabilities() == {
+            "report_agent": {"description": "report_agent agent", "tools": ["create_report"]}
+        }
+        assert instance.get_agent_capabilities() is instance.get_agent_capabilities()
+
+        instance.register_agent(_make_agent("billing_agent"))
+
+        assert set(instance.get_agent_capabilities()) == {"report_agent", "billing_agent"}
+        assert "billing_agent" in instance.list_agents()
+
+    def test_multiple_agents(self):
+        """Test that each agent's keywords map back to that agent"""
+        orchestrator = MessageOrchestrator()
+        orchestrator.register_agent(_make_agent("report_agent", ("report",)))
+        orchestrator.register_agent(_make_agent("no_keywords"))
+        orchestrator.register_agent(_make_agent("billing_agent", ("invoice", "a+b")))
+
+        assert orchestrator._should_use_agent("file a report") == "report_agent"
+        assert orchestrator._should_use_agent("where is my invoice") == "billing_agent"
+        assert orchestrator._should_use_agent("what is a+b") == "billing_agent"
+        assert orchestrator._should_use_agent("what is ab") is None
+
+
+class TestHttpClient:
+    """Test the pooled HTTP client shared by LiteLLM calls"""
+
+    def test_litellm_uses_pooled_clients(self):
+        """Test that litellm is configured with the orchestrator's clients"""
+        import litellm
+
+        assert litellm.client_session is orchestrator._HTTP_CLIENT
+        assert litellm.aclient_session is orchestrator._ASYNC_HTTP_CLIENT
+
+
+class TestAITasks:
+    """Test the background AI task pool"""
+
+    def test_submit_after_shutdown(self):
+        """Test that tasks can be submitted again after a shutdown, as on a second app lifespan"""
+        assert orchestrator.submit_ai_task(lambda: 1).result(timeout=5) == 1
+        orchestrator.shutdown_ai_tasks()
+
+        assert orchestrator.submit_ai_task(lambda: 2).result(timeout=5) == 2
+        orchestrator.shutdown_ai_tasks()
+
+
+class TestConversation:
+    """Test general conversation handling with the LLM call stubbed out"""
+
+    def test_process_message(self, monkeypatch):
+        """Test that the sync path records both sides of the exchange"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Hello!"))
+        instance = MessageOrchestrator()
+
+        assert instance.process_message(1, "hi") == "Hello!"
+        assert requests[0]["messages"][0]["role"] == "system"
+        assert requests[0]["messages"][-1] == {"role": "user", "content": "hi"}
+        assert len(instance.get_history(1)) == 2
+
+    def test_reply_is_ascii(self, monkeypatch):
+        """Test that non-ASCII characters are stripped from replies"""
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: _llm_response("Caf\u00e9 time \U0001f600"))
+        instance = MessageOrchestrator()
+
+        assert instance.process_message(1, "where should we meet today") == "Caf time "
+
+    def test_aprocess_message(self, monkeypatch):
+        """Test that the async path awaits acompletion and records the reply"""
+        async def fake_acompletion(**kwargs):
+            return _llm_response("Hello async!")
+
+        monkeypatch.setattr(orchestrator, "acompletion", fake_acompletion)
+        instance = MessageOrchestrator()
+
+        assert asyncio.run(instance.aprocess_message(1, "hi")) == "Hello async!"
+        assert instance.get_history(1).get_history()[-1] == {"role": "assistant", "content": "Hello async!"}
+
+    def test_aprocess_message_routes_to_agent(self):
+        """Test that the async path hands agent messages to the agent"""
+        instance = MessageOrchestrator()
+        agent = _make_agent("report_agent", ("report",))
+        agent.chat_func = lambda message, history, max_turns, user_id: (f"agent:{message}", history)
+        instance.register_agent(agent)
+
+        assert asyncio.run(instance.aprocess_message(1, "new report")) == "agent:new report"
+
+    def test_agent_reads_live_history(self):
+        """Test that agents get the history without a copy, including the new message"""
+        instance = MessageOrchestrator()
+        seen = []
+        agent = _make_agent("report_agent", ("report",))
+        agent.chat_func = lambda message, history, max_turns, user_id: seen.append(history) or ("done", [])
+        instance.register_agent(agent)
+
+        instance.process_message(1, "new report")
+
+        assert seen[0] is instance.get_history(1).get_history_view()
+        assert list(seen[0]) == [
+            {"role": "user", "content": "new report"},
+            {"role": "assistant", "content": "done"},
+        ]
+
+    def test_simple_message_uses_simple_model(self, monkeypatch):
+        """Test that greetings go to SIMPLE_MODEL with only recent history"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "SIMPLE_MODEL", "cheap-model")
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Hi!"))
+        instance = MessageOrchestrator()
+        history = instance.get_history(1)
+        for i in range(5):
+            history.add_user_message(f"earlier {i}")
+
+        instance.process_message(1, "Thanks!")
+
+        assert requests[0]["model"] == "cheap-model"
+        assert len(requests[0]["messages"]) == 1 + orchestrator.SIMPLE_HISTORY_MESSAGES
+        assert requests[0]["messages"][-1] == {"role": "user", "content": "Thanks!"}
+
+    def test_regular_message_uses_full_model(self, monkeypatch):
+        """Test that questions and longer messages keep the main model and full history"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "SIMPLE_MODEL", "cheap-model")
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Sure"))
+        instance = MessageOrchestrator()
+        for i in range(5):
+            instance.get_history(1).add_user_message(f"earlier {i}")
+
+        instance.process_message(1, "hi, can you help me?")
+        instance.process_message(1, "tell me about the weather in Kuala Lumpur")
+
+        assert [r["model"] for r in requests] == [orchestrator.MODEL, orchestrator.MODEL]
+        assert len(requests[0]["messages"]) == 1 + 6
+
+    def test_simple_message_must_be_whole(self):
+        """Test that only pure greetings and acknowledgements count as simple"""
+        for message in ("hi", "Thanks!", "ok thanks 👍", "Hey there, good morning!"):
+            assert orchestrator._is_simple(message), message
+        for message in ("ok so my name is Bob", "thanks, cancel all my reports", "hi?", "highway"):
+            assert not orchestrator._is_simple(message), message
+
+    def test_simple_reply_is_cached(self, monkeypatch):
+        """Test that identical simple prompts share one LLM call but both histories record it"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Hello!"))
+        instance = MessageOrchestrator()
+
+        assert instance.process_message(1, "hi") == "Hello!"
+        assert instance.process_message(2, "hi") == "Hello!"
+
+        assert len(requests) == 1
+        assert instance.get_history(2).get_history()[-1] == {"role": "assistant", "content": "Hello!"}
+
+    def test_regular_reply_is_not_cached(self, monkeypatch):
+        """Test that non-simple prompts always reach the LLM"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Sure"))
+        instance = MessageOrchestrator()
+
+        instance.process_message(1, "what can you help me with")
+        instance.process_message(2, "what can you help me with")
+
+        assert len(requests) == 2
+
+    def test_content_after_greeting_is_not_cached(self, monkeypatch):
+        """Test that a message opening with an acknowledgement is not served from the reply cache"""
+        requests = []
+        monkeypatch.setattr(orchestrator, "completion", lambda **kwargs: requests.append(kwargs) or _llm_response("Nice to meet you"))
+        instance = MessageOrchestrator()
+
+        instance.process_message(1, "ok so my name is Bob")
+        instance.process_message(2, "ok so my name is Bob")
+
+        assert len(requests) == 2
+        assert len(orchestrator._reply_cache) == 0
+
+
+class TestReportAgentMessages:
+    """Test the report agent's request prefix"""
+
+    def test_prefix_is_stable(self):
+        """Test that the system message is the same object every call and history follows it"""
+        from orchestrator import report_agent
+
+        history = [{"role": "user", "content": "earlier"}]
+        first = report_agent.build_messages(history, "list my reports")
+        second = report_agent.build_messages([], "new report")
+
+        assert first[0] is second[0]
+        assert first[1:] == [history[0], {"role": "user", "content": "list my reports"}]
+        assert "Available functions:\n- create_report" in first[0]["content"]
+
+    def test_tools_are_frozen_in_name_order(self):
+        """Test that TOOLS is an immutable, name-sorted tuple the system prompt follows"""
+        from orchestrator import report_agent
+
+        names = [tool["function"]["name"] for tool in report_agent.TOOLS]
+        assert isinstance(report_agent.TOOLS, tuple)
+        assert names == sorted(names)
+        assert report_agent._FULL_SYSTEM_PROMPT.endswith(
+            "\n".join(f"- {name}: {tool['function']['description']}" for name, tool in zip(names, report_agent.TOOLS))
+        )
+
+    def test_anthropic_system_block_is_cache_marked(self):
+        """Test that anthropic models get cache_control on the system prompt"""
+        from orchestrator import report_agent
+
+        messages = report_agent.build_messages([], "hi", "anthropic/claude-sonnet")
+
+        assert messages[0]["content"][0]["cache_control"] == {"type": "ephemeral"}
+        assert messages[0]["content"][0]["text"] == report_agent._FULL_SYSTEM_PROMPT
+
+
+class TestReportAgentChat:
+    """Test the report agent's tool-calling turn with the LLM stubbed out"""
+
+    def test_tool_results_feed_follow_up(self, monkeypatch):
+        """Test that tool results are appended in call order before the follow-up request"""
+        from orchestrator import report_agent
+
+        tool_calls = [
+            SimpleNamespace(id="call_1", function=SimpleNamespace(name="get_report", arguments='{"report_id": 7}')),
+            SimpleNamespace(id="call_2", function=SimpleNamespace(name="missing", arguments="{}")),
+        ]
+        first = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=None, tool_calls=tool_calls))])
+        requests = []
+        responses = iter([first, _llm_response("Report #7 is open")])
+        monkeypatch.setattr(report_agent, "completion", lambda **kwargs: requests.append(kwargs) or next(responses))
+        monkeypatch.setattr(report_agent, "AVAILABLE_FUNCTIONS", {
+            "get_report": lambda user_id, report_id: f"report {report_id} for {user_id}",
+        })
+
+        content, history = report_agent.chat("show report 7", [], user_id=3)
+
+        assert content == "Report #7 is open"
+        tool_messages = [m for m in requests[1]["messages"] if isinstance(m, dict) and m["role"] == "tool"]
+        assert [m["tool_call_id"] for m in tool_messages] == ["call_1", "call_2"]
+        assert tool_messages[0]["content"] == "report 7 for 3"
+        assert tool_messages[1]["content"] == "Error: Function missing not available"
+        assert history[-1] == {"role": "assistant", "content": "Report #7 is open"}
+
+    def test_tool_calls_run_concurrently(self, monkeypatch):
+        """Test that several tool calls in one turn overlap instead of running back to back"""
+        from orchestrator import report_agent
+
+        tool_calls = [
+            SimpleNamespace(id=f"call_{i}", function=SimpleNamespace(name="slow", arguments=f'{{"n": {i}}}'))
+            for i in range(3)
+        ]
+        first = SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=None, tool_calls=tool_calls))])
+        requests = []
+        responses = iter([first, _llm_response("done")])
+        monkeypatch.setattr(report_agent, "completion", lambda **kwargs: requests.append(kwargs) or next(responses))
+        barrier = threading.Barrier(3, timeout=5)
+
+        def slow(user_id, n):
+            barrier.wait()  # only passes if all three calls are in flight at once
+            return f"result {n}"
+
+        monkeypatch.setattr(report_agent, "AVAILABLE_FUNCTIONS", {"slow": slow})
+
+        content, _ = report_agent.chat("list reports", [], user_id=1)
+
+        assert content == "done"
+        tool_messages = [m for m in requests[1]["messages"] if isinstance(m, dict) and m["role"] == "tool"]
+        assert [m["content"] for m in tool_messages] == ["result 0", "result 1", "result 2"]
+
+
+# ==================== RUNNER ====================
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
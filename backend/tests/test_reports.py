@@ -19,7 +19,7 @@ from sqlalchemy.orm import sessionmaker
 from main import app
 from db.config import Base, get_db
 from db.models import User, Report
-from auth.utils import create_access_token
+from auth.utils import create_access_token, _user_cache
 
 
 # Test database setup
@@ -103,6 +103,7 @@ class TestReportsIntegration:
         Base.metadata.create_all(bind=engine)
         yield
         Base.metadata.drop_all(bind=engine)
+        _user_cache.clear()  # user ids are reused across tests
 
     @pytest.fixture
     def test_user(self):
@@ -453,6 +454,52 @@ class TestReportsIntegration:
         assert response.json()["resolved_by"] == response.json()["resolved_by"]  # admin id
         assert response.json()["resolved_at"] is not None
 
+    def test_resolve_drops_agent_report_cache(self, test_user, auth_headers, auth_headers_superuser):
+        """Test that resolving through the API clears the agent's cached report list"""
+        from orchestrator import report_agent
+        client = TestClient(app)
+        
+        report_id = client.post(
+            "/reports",
+            json={"title": "Issue", "content": "Content"},
+            headers=auth_headers
+        ).json()["id"]
+        report_agent._reports_cache[(test_user, None)] = "stale"
+        
+        client.put(
+            f"/reports/{report_id}/resolve",
+            json={"comment": "Fixed"},
+            headers=auth_headers_superuser
+        )
+        assert (test_user, None) not in report_agent._reports_cache
+
+    def test_reporter_and_resolver_usernames(self, auth_headers, auth_headers_superuser):
+        """Test that list and detail endpoints include reporter and resolver usernames"""
+        client = TestClient(app)
+        
+        resolved_id = client.post(
+            "/reports",
+            json={"title": "Resolved", "content": "Content"},
+            headers=auth_headers
+        ).json()["id"]
+        client.post("/reports", json={"title": "Open", "content": "Content"}, headers=auth_headers)
+        client.put(
+            f"/reports/{resolved_id}/resolve",
+            json={"comment": "Fixed"},
+            headers=auth_headers_superuser
+        )
+        
+        mine = {r["title"]: r for r in client.get("/reports", headers=auth_headers).json()}
+        assert mine["Resolved"]["resolver_username"] == "admin"
+        assert mine["Open"]["resolver_username"] is None
+        
+        everything = client.get("/reports/admin/all", headers=auth_headers_superuser).json()
+        assert {r["reporter_username"] for r in everything} == {"testuser"}
+        
+        detail = client.get(f"/reports/{resolved_id}", headers=auth_headers).json()
+        assert detail["reporter_username"] == "testuser"
+        assert detail["resolver_username"] == "admin"
+
     def test_superuser_filter_reports_by_status(self, auth_headers, auth_headers_superuser):
         """Test superuser can filter reports by status"""
         client = TestClient(app)
@@ -601,6 +648,7 @@ class TestReportsEdgeCases:
         Base.metadata.create_all(bind=engine)
         yield
         Base.metadata.drop_all(bind=engine)
+        _user_cache.clear()  # user ids are reused across tests
 
     @pytest.fixture
     def test_user(self):